@@ -12,6 +12,8 @@ def pytest_addoption(parser):
         help="Pokedex database URI")
     group.addoption("--index", action="store", default=None,
         help="Path to index directory")
+    group.addoption("--load-engine", action="store", default=None,
+        help="URI of a scratch database for testing `pokedex load` (its pokedex tables WILL be dropped; if not specified, those tests are skipped)")
     group.addoption("--media-root", action="store", default=None,
         help="Root for the media files (if not specified and pokedex/data/media doesn't exist, tests are skipped)")
     group.addoption("--all", action="store_true", default=False,
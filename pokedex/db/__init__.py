@@ -1,7 +1,11 @@
 # encoding: utf-8
+import os
 import re
 
+import six
+from six.moves.urllib.parse import quote
 from sqlalchemy import engine_from_config, orm
+from sqlalchemy.engine.url import make_url
 
 from ..defaults import get_default_db_uri
 from .tables import metadata
@@ -10,12 +14,24 @@ from .multilang import MultilangSession, MultilangScopedSession
 ENGLISH_ID = 9
 
 
-def connect(uri=None, session_args={}, engine_args={}, engine_prefix=''):
+def connect(uri=None, session_args={}, engine_args={}, engine_prefix='',
+            read_only=False, local_infile=False):
     """Connects to the requested URI.  Returns a session object.
 
     With the URI omitted, attempts to connect to a default SQLite database
     contained within the package directory.
 
+    With `read_only`, a SQLite database is opened as immutable (see
+    `pokedex build-sqlite`): SQLite doesn't lock it or check it for changes,
+    so any number of processes can read it at once.  Nothing may write to
+    the file while it's open this way.  (On Python 2, it's only made
+    read-only; see _read_only_sqlite_creator.)
+
+    With `local_infile`, a MySQL connection allows LOAD DATA LOCAL INFILE,
+    which `pokedex load` uses to have the server read the CSV files.  It's
+    off otherwise, since it lets the server ask for any file the client can
+    read.
+
     Calling this function also binds the metadata object to the created engine.
     """
 
@@ -32,6 +48,11 @@ def connect(uri=None, session_args={}, engine_args={}, engine_prefix=''):
         if 'charset' not in uri:
             uri += '?charset=utf8'
 
+        # `pokedex load` uses LOAD DATA LOCAL INFILE, which the client has to
+        # allow explicitly
+        if local_infile and 'local_infile' not in uri:
+            uri += ('&' if '?' in uri else '?') + 'local_infile=1'
+
         # Tables should be InnoDB, in the event that we're creating them, and
         # use UTF-8 goddammit!
         for table in metadata.tables.values():
@@ -43,6 +64,14 @@ def connect(uri=None, session_args={}, engine_args={}, engine_prefix=''):
         if 'auto_setinputsizes' not in uri:
             uri += '?auto_setinputsizes=FALSE'
 
+    # Don't change the caller's dict (or the default one)
+    engine_args = dict(engine_args)
+
+    if read_only:
+        if not uri.startswith('sqlite:'):
+            raise ValueError("Only SQLite databases can be opened read-only")
+        engine_args[engine_prefix + 'creator'] = _read_only_sqlite_creator(uri)
+
     ### Connect
     engine_args[engine_prefix + 'url'] = uri
     engine = engine_from_config(engine_args, prefix=engine_prefix)
@@ -57,6 +86,33 @@ def connect(uri=None, session_args={}, engine_args={}, engine_prefix=''):
 
     return session
 
+def _read_only_sqlite_creator(uri):
+    """Returns a function that opens the SQLite database at `uri` with
+    mode=ro&immutable=1.
+
+    Python 2's sqlite3 can't open URIs, so there the database is opened as
+    usual and made read-only with PRAGMA query_only.  It's still locked and
+    checked for changes like any other database.
+    """
+    import sqlite3
+
+    path = make_url(uri).database
+    if not path or path == ':memory:':
+        raise ValueError("An in-memory database can't be opened read-only")
+    path = os.path.abspath(path)
+
+    if six.PY3:
+        file_uri = 'file:%s?mode=ro&immutable=1' % quote(path)
+
+        def creator():
+            return sqlite3.connect(file_uri, uri=True, check_same_thread=False)
+    else:
+        def creator():
+            connection = sqlite3.connect(path, check_same_thread=False)
+            connection.execute("PRAGMA query_only = 1")
+            return connection
+    return creator
+
 def identifier_from_name(name):
     """Make a string safe to use as an identifier.
 
@@ -0,0 +1,302 @@
+"""Compiled, memory-mappable cache of the CSV files.
+
+Parsing the CSV files and decoding their text is most of the work of loading
+them.  A cache file holds the same rows, already converted, stored column by
+column: integer and boolean columns as arrays of machine integers, and text
+columns as an array of offsets into a heap of UTF-8 strings.  Reading one
+just maps it into memory and slices it; nothing is parsed.
+
+Every cache file records the SHA-1 of the CSV file it was built from, and is
+ignored (and rebuilt by whoever wants it) once that changes.
+
+The layout of a cache file is:
+
+    MAGIC
+    header length, as a little-endian 32-bit integer
+    header, as JSON
+    sections, each aligned to 8 bytes
+
+The header has the CSV hash, the number of rows, and for each column its
+name, kind, and the offset and length of each of its sections: "values", an
+array of integers (or for text, of heap offsets, one more than the number of
+rows); "heap", the UTF-8 text; and "nulls", an array of flags that's only
+there if the column has any NULLs.
+"""
+
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+
+import six
+import sqlalchemy.types
+
+MAGIC = b'PDXCACHE'
+VERSION = 1
+
+INTEGER = 'integer'
+BOOLEAN = 'boolean'
+TEXT = 'text'
+
+# Python 2's array module has no 'q'; 'l' is 64 bits on the platforms that
+# matter there.  The typecode is stored in the header, so a cache built with
+# a different one is simply rebuilt.
+try:
+    array.array('q')
+    _int_typecode = 'q'
+except ValueError:
+    _int_typecode = 'l'
+_flag_typecode = 'b'
+
+_align = 8
+
+# Files are hashed this many bytes at a time, rather than read whole
+_hash_chunk_size = 1 << 16
+
+
+def hash_file(path):
+    """Returns the SHA-1 hex digest of a file's contents, or None if the file
+    doesn't exist.
+    """
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+    sha1 = hashlib.sha1()
+    with f:
+        for chunk in iter(lambda: f.read(_hash_chunk_size), b''):
+            sha1.update(chunk)
+    return six.text_type(sha1.hexdigest())
+
+
+def get_kind(column):
+    """Returns the kind of cache column to store a table column in."""
+    if isinstance(column.type, sqlalchemy.types.Boolean):
+        return BOOLEAN
+    elif isinstance(column.type, sqlalchemy.types.Integer):
+        return INTEGER
+    else:
+        return TEXT
+
+
+def _encode_column(kind, values):
+    """Returns the sections for one column: a dict of name to bytes."""
+    nulls = array.array(_flag_typecode, [value is None for value in values])
+    if kind == TEXT:
+        offsets = array.array(_int_typecode, [0])
+        heap = []
+        position = 0
+        for value in values:
+            if value is not None:
+                encoded = value.encode('utf-8')
+                heap.append(encoded)
+                position += len(encoded)
+            offsets.append(position)
+        sections = dict(values=offsets.tostring() if six.PY2 else offsets.tobytes(),
+                        heap=b''.join(heap))
+    else:
+        typecode = _int_typecode if kind == INTEGER else _flag_typecode
+        encoded = array.array(typecode, [0 if value is None else value
+                                         for value in values])
+        sections = dict(values=encoded.tostring() if six.PY2 else encoded.tobytes())
+
+    if any(nulls):
+        sections['nulls'] = nulls.tostring() if six.PY2 else nulls.tobytes()
+    return sections
+
+
+def build_cache(path, sha1, column_names, kinds, rows):
+    """Writes a cache file for the CSV file with the hash `sha1`.
+
+    `rows` are tuples of already converted values (None for NULL), in the
+    order of `column_names`; `kinds` gives the kind of each column.
+
+    The file is written under a temporary name and then moved into place, so
+    readers never see a half-written cache.
+    """
+    columns = [[] for column_name in column_names]
+    row_count = 0
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+        row_count += 1
+
+    header_columns = []
+    chunks = []
+    position = 0
+    for column_name, kind, values in zip(column_names, kinds, columns):
+        sections = {}
+        for section_name, data in sorted(_encode_column(kind, values).items()):
+            sections[section_name] = [position, len(data)]
+            padding = -len(data) % _align
+            chunks.append(data + b'\0' * padding)
+            position += len(data) + padding
+        header_columns.append(dict(name=column_name, kind=kind,
+                                   sections=sections))
+
+    header = json.dumps(dict(
+        version=VERSION,
+        sha1=sha1,
+        byteorder=sys.byteorder,
+        typecodes=[_int_typecode, _flag_typecode],
+        rows=row_count,
+        columns=header_columns,
+    )).encode('ascii')
+    # Sections start at an aligned offset after the header
+    start = len(MAGIC) + 4 + len(header)
+    header += b' ' * (-start % _align)
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Someone else made it in the meantime
+            if not os.path.isdir(directory):
+                raise
+
+    temp_path = '%s.%s-%s.tmp' % (path, os.getpid(), threading.current_thread().ident)
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for chunk in chunks:
+            f.write(chunk)
+    getattr(os, 'replace', os.rename)(temp_path, path)
+
+
+def open_cache(path, sha1, kinds=None):
+    """Opens the cache file at `path`.
+
+    Returns None if there's no such file, or if it wasn't built from the CSV
+    file with the hash `sha1` by a compatible version of this module.  If
+    `kinds` is given, the columns must also be of those kinds.
+    """
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+
+    try:
+        magic = f.read(len(MAGIC))
+        header_size = f.read(4)
+        if magic != MAGIC or len(header_size) != 4:
+            f.close()
+            return None
+        header_size, = struct.unpack('<I', header_size)
+        header = json.loads(f.read(header_size).decode('ascii'))
+    except ValueError:
+        f.close()
+        return None
+
+    if (header.get('version') != VERSION or header['sha1'] != sha1 or
+            header['byteorder'] != sys.byteorder or
+            header['typecodes'] != [_int_typecode, _flag_typecode] or
+            (kinds is not None and
+             [column['kind'] for column in header['columns']] != list(kinds))):
+        f.close()
+        return None
+
+    return CSVCache(f, len(MAGIC) + 4 + header_size, header)
+
+
+class CSVCache(object):
+    """An open cache file.
+
+    Iterating over it gives the rows as tuples of converted values;
+    `iter_batches` gives them in lists.  `progress()` tells how far along
+    that is.
+    """
+    def __init__(self, f, start, header):
+        self.file = f
+        self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.mmap)
+        self.start = start
+        self.rows = header['rows']
+        self.column_names = [column['name'] for column in header['columns']]
+        self.position = 0
+        self._views = []
+        self._columns = [self._open_column(column)
+                         for column in header['columns']]
+
+    def _view(self, section, typecode):
+        offset, length = section
+        offset += self.start
+        if six.PY2:
+            return array.array(typecode, self.mmap[offset:offset + length])
+        view = memoryview(self.mmap)[offset:offset + length].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def _open_column(self, column):
+        kind = column['kind']
+        sections = column['sections']
+        if kind == TEXT:
+            values = self._view(sections['values'], _int_typecode)
+            heap_start = self.start + sections['heap'][0]
+        elif kind == INTEGER:
+            values = self._view(sections['values'], _int_typecode)
+            heap_start = None
+        else:
+            values = self._view(sections['values'], _flag_typecode)
+            heap_start = None
+        if 'nulls' in sections:
+            nulls = self._view(sections['nulls'], _flag_typecode)
+        else:
+            nulls = None
+        return kind, values, heap_start, nulls
+
+    def _read_column(self, column, start, end):
+        kind, values, heap_start, nulls = column
+        if kind == TEXT:
+            data = self.mmap
+            offsets = [heap_start + offset
+                       for offset in values[start:end + 1].tolist()]
+            result = [data[a:b].decode('utf-8')
+                      for a, b in zip(offsets, offsets[1:])]
+        elif kind == INTEGER:
+            result = values[start:end].tolist()
+        else:
+            result = [bool(value) for value in values[start:end].tolist()]
+
+        if nulls is not None:
+            result = [None if null else value for value, null
+                      in zip(result, nulls[start:end].tolist())]
+        return result
+
+    def iter_batches(self, batch_size=1000):
+        """Yields the rows in lists of at most `batch_size` row tuples."""
+        for start in range(0, self.rows, batch_size):
+            end = min(start + batch_size, self.rows)
+            columns = [self._read_column(column, start, end)
+                       for column in self._columns]
+            self.position = end
+            yield list(zip(*columns))
+
+    def __iter__(self):
+        for batch in self.iter_batches():
+            for row in batch:
+                yield row
+
+    def progress(self):
+        if not self.rows:
+            return "100%"
+        return "%d%%" % (100 * self.position // self.rows)
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._columns = []
+        self.mmap.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -52,3 +52,42 @@ def find_dependent_tables(tables, graph=None):
     dependents -= set(tables)
 
     return dependents
+
+def compute_dependency_levels(tables, graph=None):
+    """Group the given tables into levels that can be loaded together.
+
+    Returns a list of lists of tables.  Every table only depends on tables in
+    earlier levels, so all tables within one level can be loaded in parallel.
+    Dependencies on tables outside `tables` are ignored.
+    """
+    tables = list(tables)
+    if graph is None:
+        graph = compute_dependencies(tables)
+    table_set = set(tables)
+
+    # Count each table's unloaded parents
+    parent_counts = dict((table, 0) for table in tables)
+    for parent, children in graph.items():
+        if parent not in table_set:
+            continue
+        for child in set(children):
+            if child in table_set and child is not parent:
+                parent_counts[child] += 1
+
+    levels = []
+    current = [table for table in tables if not parent_counts[table]]
+    while current:
+        levels.append(sorted(current, key=lambda table: table.name))
+        next_level = []
+        for parent in current:
+            for child in set(graph.get(parent, [])):
+                if child in table_set and child is not parent:
+                    parent_counts[child] -= 1
+                    if not parent_counts[child]:
+                        next_level.append(child)
+        current = next_level
+
+    if sum(len(level) for level in levels) != len(tables):
+        raise ValueError("Circular dependency between tables")
+
+    return levels
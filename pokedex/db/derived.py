@@ -0,0 +1,77 @@
+"""Tables whose contents are computed from other tables.
+
+Each derived table is defined by a single SELECT over its source tables.
+`load` regenerates it with one INSERT ... SELECT whenever it or any of its
+sources gets loaded, instead of building the rows in Python.
+
+To add one, write a function that returns the SELECT, with one column per
+column of the derived table, and register it::
+
+    @derived_table(tables.Foo, sources=[tables.Bar, tables.Baz])
+    def foo():
+        return select([...])
+"""
+
+from sqlalchemy import and_, select
+from sqlalchemy.sql import exists
+
+from pokedex.db import tables as t
+
+
+class DerivedTable(object):
+    """A table that's regenerated from `sources` by inserting the result of
+    `make_select()`.
+    """
+    def __init__(self, table, sources, make_select):
+        self.table = table
+        self.sources = sources
+        self.make_select = make_select
+
+    def should_regenerate(self, table_names):
+        """Returns True if this table needs to be regenerated after loading
+        the tables named in `table_names`.
+        """
+        return (self.table.key in table_names or
+                any(source.key in table_names for source in self.sources))
+
+    def regenerate(self, session):
+        """Replaces the contents of the table.  Returns the number of rows
+        inserted.
+        """
+        query = self.make_select()
+        columns = [column.name for column in self.table.c]
+        session.execute(self.table.delete())
+        result = session.execute(
+            self.table.insert().from_select(columns, query))
+        return result.rowcount
+
+
+#: Registered derived tables, in the order they're regenerated
+derived_tables = []
+
+def derived_table(table_class, sources):
+    """Registers the decorated function as the SELECT that `table_class` is
+    derived from.  `sources` is a list of table classes whose changes affect
+    it.
+    """
+    def decorator(make_select):
+        derived_tables.append(DerivedTable(
+            table_class.__table__,
+            [source.__table__ for source in sources],
+            make_select,
+        ))
+        return make_select
+    return decorator
+
+
+@derived_table(t.VersionGroupPokemonMoveMethod,
+               sources=[t.PokemonMove, t.VersionGroup, t.PokemonMoveMethod])
+def _version_group_pokemon_move_methods():
+    """Every move method that some Pokemon uses in a version group."""
+    return select([
+        t.VersionGroup.id,
+        t.PokemonMoveMethod.id,
+    ]).where(exists().where(and_(
+        t.PokemonMove.pokemon_move_method_id == t.PokemonMoveMethod.id,
+        t.PokemonMove.version_group_id == t.VersionGroup.id,
+    )))
@@ -1,24 +1,50 @@
 """CSV to database or vice versa."""
 from __future__ import print_function
 
+import contextlib
 import csv
 import fnmatch
+import hashlib
+import json
 import os.path
 import sys
+import time
+from multiprocessing.pool import ThreadPool
 
 import six
+import sqlalchemy.orm
+import sqlalchemy.schema
 import sqlalchemy.sql.util
+import sqlalchemy.sql.visitors
 import sqlalchemy.types
 
 import pokedex
 import pokedex.db.tables as t
-from pokedex.db import metadata, translations
+from pokedex.db import csvcache, derived, metadata, translations
 from pokedex.defaults import get_default_csv_dir
-from pokedex.db.dependencies import find_dependent_tables
+from pokedex.db.dependencies import compute_dependency_levels, find_dependent_tables
 from pokedex.db.oracle import rewrite_long_table_names
 
-from sqlalchemy import and_
-from sqlalchemy.sql import exists
+from sqlalchemy import Column, MetaData, Table
+from sqlalchemy.types import Unicode
+
+# Settings for fast but unsafe loading into SQLite.  They only last as long as
+# the connection they're set on.
+_sqlite_bulk_pragmas = [
+    "PRAGMA synchronous=OFF",
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA cache_size=-65536",  # in KiB, so 64 MiB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA locking_mode=EXCLUSIVE",
+]
+
+# Bookkeeping for incremental loads.  This isn't part of the pokedex schema,
+# so it has its own metadata and is never dumped or dropped.
+load_metadata = MetaData()
+csv_hashes_table = Table('pokedex_csv_hashes', load_metadata,
+    Column('filename', Unicode(79), primary_key=True, nullable=False),
+    Column('sha1', Unicode(40), nullable=True),
+)
 
 
 def _get_table_names(metadata, patterns):
@@ -103,7 +129,544 @@ def _get_verbose_prints(verbose):
     return print_start, print_status, print_done
 
 
-def load(session, tables=[], directory=None, drop_tables=False, verbose=False, safe=True, recursive=True, langs=None):
+def _get_csv_table_name(table_obj, oracle=False):
+    """Returns the name of the CSV file (sans extension) for a table."""
+    if oracle:
+        return table_obj._original_name
+    else:
+        return table_obj.name
+
+
+def _get_translation_filenames(directory, langs):
+    """Returns the names of the translation files for `langs` (or all of them,
+    if `langs` is None), relative to `directory`.
+    """
+    filenames = []
+    translation_dir = os.path.join(directory, 'translations')
+    if os.path.isdir(translation_dir):
+        for filename in sorted(os.listdir(translation_dir)):
+            lang, ext = os.path.splitext(filename)
+            if ext == '.csv' and (langs is None or lang in langs):
+                filenames.append('translations/' + filename)
+    return filenames
+
+
+def _get_csv_hashes(directory, filenames):
+    """Returns a dict mapping the given CSV filenames, relative to
+    `directory`, to their content hashes.
+    """
+    return dict((filename, csvcache.hash_file(os.path.join(directory, filename)))
+                for filename in filenames)
+
+
+def _find_changed_tables(session, table_objs, csv_hashes, oracle=False):
+    """Returns the tables among `table_objs` that need to be reloaded, plus
+    any existing tables that depend on them.
+
+    A table needs to be reloaded if it doesn't exist yet, or if its CSV file
+    doesn't match the hash recorded by the last load.  If any translation file
+    changed, all translation tables are reloaded too.
+    """
+    existing_names = set(sqlalchemy.inspect(session.get_bind()).get_table_names())
+    recorded = dict(session.execute(csv_hashes_table.select()).fetchall())
+
+    def changed(filename):
+        return (filename not in recorded or
+                recorded[filename] != csv_hashes[filename])
+
+    changed_tables = set()
+    for table_obj in table_objs:
+        filename = _get_csv_table_name(table_obj, oracle) + '.csv'
+        if changed(filename) or table_obj.name not in existing_names:
+            changed_tables.add(table_obj)
+
+    if any(changed(filename) for filename in csv_hashes
+           if filename.startswith('translations/')):
+        changed_tables.update(_get_translation_tables() & set(table_objs))
+
+    changed_tables.update(
+        table for table in find_dependent_tables(changed_tables)
+        if table.name in existing_names)
+    return sqlalchemy.sql.util.sort_tables(changed_tables)
+
+
+def _get_translation_tables():
+    """Returns the set of tables that translations get loaded into."""
+    return set(translation_class.__table__ for translation_class
+               in translations.translation_class_by_column.values())
+
+
+def _record_csv_hashes(session, csv_hashes):
+    """Records the content hashes of freshly loaded CSV files."""
+    if not csv_hashes:
+        return
+    session.execute(csv_hashes_table.delete().where(
+        csv_hashes_table.c.filename.in_(list(csv_hashes))))
+    session.execute(csv_hashes_table.insert(), [
+        dict(filename=filename, sha1=sha1)
+        for filename, sha1 in sorted(csv_hashes.items())
+    ])
+    session.commit()
+
+
+def _get_column_converter(column):
+    """Returns a function that turns a CSV value into a value for `column`."""
+    if isinstance(column.type, sqlalchemy.types.Boolean):
+        # Boolean values are stored as string values 0/1, but both of those
+        # evaluate as true; SQLA wants True/False
+        def convert(value):
+            return value != '0'
+    elif isinstance(column.type, sqlalchemy.types.Integer):
+        convert = int
+    elif six.PY2:
+        # Otherwise, unflatten from bytes
+        def convert(value):
+            return value.decode('utf-8')
+    else:
+        convert = six.text_type
+
+    if not column.nullable:
+        return convert
+
+    def convert_nullable(value):
+        # Empty string in a nullable column really means NULL
+        if value == '':
+            return None
+        return convert(value)
+    return convert_nullable
+
+
+def _get_row_converter(table_obj, column_names):
+    """Returns a function that turns a row of CSV values for the given columns
+    into a tuple of values ready for inserting.
+
+    The per-column work is figured out once per table, so converting a row is
+    just a matter of calling one function per cell.
+    """
+    converters = tuple(_get_column_converter(table_obj.c[column_name])
+                       for column_name in column_names)
+
+    def convert_row(csvs):
+        return tuple([convert(value) for convert, value in zip(converters, csvs)])
+    return convert_row
+
+
+class _CSVProgressReader(object):
+    """Iterates over the lines of a CSV file opened in binary mode, decoding
+    them on the way and keeping track of how many bytes have been read.
+
+    This lets us show progress, and hash the file, while reading it just
+    once.  (Python 3 doesn't allow .tell() on a file that's currently being
+    iterated.)
+    """
+    def __init__(self, csvfile):
+        self.csvfile = csvfile
+        self.size = os.fstat(csvfile.fileno()).st_size
+        self.position = 0
+        self.sha1 = hashlib.sha1()
+
+    def __iter__(self):
+        for line in self.csvfile:
+            self.position += len(line)
+            self.sha1.update(line)
+            if six.PY2:
+                yield line
+            else:
+                yield line.decode('utf-8')
+
+    def progress(self):
+        if not self.size:
+            return "100%"
+        return "%d%%" % (100 * self.position // self.size)
+
+    def hexdigest(self):
+        """Returns the SHA-1 of what has been read so far."""
+        return six.text_type(self.sha1.hexdigest())
+
+
+def _iter_batches(rows, batch_size):
+    """Groups an iterable of rows into lists of at most `batch_size` rows."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _LoadProfile(object):
+    """Collects the wall time, row and byte counts, and number of commits of
+    each phase of a load, to be written out as a JSON report.
+    """
+    def __init__(self, engine, **settings):
+        self.dialect = engine.dialect.name
+        self.settings = settings
+        self.start = time.time()
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name, table=None):
+        """Times the phase `name`.  Yields a dict for the caller to fill in
+        `rows`, `bytes` and `commits`.
+        """
+        stats = dict(phase=name, rows=0, bytes=0, commits=0)
+        if table is not None:
+            stats['table'] = table
+        start = time.time()
+        try:
+            yield stats
+        finally:
+            seconds = time.time() - start
+            stats['seconds'] = round(seconds, 6)
+            if seconds and stats['rows']:
+                stats['rows_per_second'] = round(stats['rows'] / seconds, 1)
+            else:
+                stats['rows_per_second'] = None
+            # Appending is atomic, so workers from _load_tables_parallel can
+            # share the profile
+            self.phases.append(stats)
+
+    def write(self, filename):
+        report = dict(
+            dialect=self.dialect,
+            settings=self.settings,
+            seconds=round(time.time() - self.start, 6),
+            phases=self.phases,
+        )
+        with open(filename, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+def _sort_self_referential_rows(rows, id_index, self_ref_indexes):
+    """Sorts the rows of a self-referential table so that every row comes
+    after the rows it refers to, e.g. a Pokémon species after the species it
+    evolves from.  References can be any number of levels deep.
+
+    Rows are kept in their original order as far as possible: each pass over
+    the rows that are still waiting yields those whose references have all
+    been yielded.  Rows within a batch are inserted in order, so the sorted
+    rows can be inserted in ordinary batches.
+
+    ASSUMPTION: Self-referential tables have a single PK called "id"
+    """
+    waiting = []  # ( row referring to id, {foreign ids we need} )
+    all_ids = set()
+    for row in rows:
+        foreign_ids = set(row[i] for i in self_ref_indexes)
+        foreign_ids.discard(None)  # remove NULL ids
+        foreign_ids.discard(row[id_index])  # rows may refer to themselves
+        waiting.append((row, foreign_ids))
+        all_ids.add(row[id_index])
+
+    for row, foreign_ids in waiting:
+        if not foreign_ids <= all_ids:
+            raise ValueError("Row refers to rows that don't exist!  "
+                             "Row was: " + str(row))
+
+    seen_ids = set()  # primary keys we've yielded
+    while waiting:
+        still_waiting = []
+        for row, foreign_ids in waiting:
+            if foreign_ids <= seen_ids:
+                seen_ids.add(row[id_index])
+                yield row
+            else:
+                still_waiting.append((row, foreign_ids))
+
+        if len(still_waiting) == len(waiting):
+            raise ValueError("Circular self-reference!  "
+                             "Rows were: " + str([row for row, _ in waiting]))
+        waiting = still_waiting
+
+
+def _load_table(session, table_obj, print_status, directory, safe, oracle,
+                batch_size, stats=None, cache_dir=None, csv_hashes=None):
+    """Loads one table's CSV file into the database.
+
+    The file is read once and streamed into the database in batches of
+    `batch_size` rows, so memory use doesn't depend on its size.  If given,
+    the `stats` dict gets the number of rows and bytes loaded and commits
+    made.
+
+    With a `cache_dir`, rows are read from the table's cache file there
+    instead, which is (re)built from the CSV file if its hash has changed.
+    The COPY and LOAD DATA fast paths read the CSV file directly regardless.
+
+    `csv_hashes` is a dict of CSV filenames to content hashes.  The table's
+    hash is taken from it if it's there, and otherwise put there once the
+    file has been read, except by COPY and LOAD DATA, which read it without
+    us seeing it.
+
+    Returns a short message to show when the table is done.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(rows=0, bytes=0, commits=0)
+
+    engine = session.get_bind()
+    table_name = _get_csv_table_name(table_obj, oracle)
+    if csv_hashes is None:
+        csv_hashes = {}
+    csv_filename = table_name + '.csv'
+
+    insert_stmt = table_obj.insert()
+
+    try:
+        csvpath = "%s/%s.csv" % (directory, table_name)
+        csvfile = open(csvpath, 'rb')
+    except IOError:
+        # File doesn't exist; don't load anything!
+        return 'missing?'
+
+    cache = None
+    try:
+        lines = _CSVProgressReader(csvfile)
+        reader = csv.reader(lines, lineterminator='\n')
+        column_names = [six.text_type(column) for column in next(reader)]
+
+        if not safe and engine.dialect.name == 'postgresql':
+            # Postgres' CSV dialect works with our data, if we mark the not-null
+            # columns with FORCE NOT NULL.
+            not_null_cols = [c for c in column_names if not table_obj.c[c].nullable]
+            if not_null_cols:
+                force_not_null = 'FORCE NOT NULL ' + ','.join('"%s"' % c for c in not_null_cols)
+            else:
+                force_not_null = ''
+
+            # Grab the underlying psycopg2 cursor so we can use COPY FROM STDIN
+            raw_conn = engine.raw_connection()
+            cursor = raw_conn.cursor()
+            command = "COPY %(table_name)s (%(columns)s) FROM STDIN CSV HEADER %(force_not_null)s"
+            csvfile.seek(0)
+            cursor.copy_expert(
+                command % dict(
+                    table_name=table_name,
+                    columns=','.join('"%s"' % c for c in column_names),
+                    force_not_null=force_not_null,
+                ),
+                csvfile,
+            )
+            raw_conn.commit()
+            stats.update(rows=cursor.rowcount, bytes=lines.size, commits=1)
+            return 'ok'
+
+        if not safe and engine.dialect.name == 'mysql':
+            # MySQL can read the CSV file itself, if the connection allows
+            # LOCAL INFILE (see pokedex.db.connect's `local_infile`).  Every
+            # value is read into a variable first, so it can be converted the
+            # same way _get_column_converter() would.
+            preparer = engine.dialect.identifier_preparer
+            variables = []
+            assignments = []
+            for n, column_name in enumerate(column_names):
+                column = table_obj.c[column_name]
+                value = variable = '@v%d' % n
+                if column.nullable:
+                    # Empty string in a nullable column really means NULL
+                    value = "NULLIF(%s, '')" % value
+                if isinstance(column.type, sqlalchemy.types.Boolean):
+                    # Anything but 0 is true; NULL stays NULL
+                    value = "(%s <> '0')" % value
+                variables.append(variable)
+                assignments.append('%s = %s' % (preparer.quote(column_name), value))
+
+            command = (
+                "LOAD DATA LOCAL INFILE %%s INTO TABLE %(table_name)s "
+                "CHARACTER SET utf8 "
+                "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+                "LINES TERMINATED BY '\\n' "
+                "IGNORE 1 LINES (%(variables)s) SET %(assignments)s"
+            ) % dict(
+                table_name=preparer.format_table(table_obj),
+                variables=','.join(variables),
+                assignments=', '.join(assignments),
+            )
+            # InnoDB checks foreign keys row by row, and LOAD DATA can't put
+            # rows that refer to later rows of the same table (like Pikachu,
+            # which evolves from Pichu) in order the way
+            # _sort_self_referential_rows() does.  So don't check them for
+            # self-referential tables; the CSV files are consistent anyway.
+            self_referential = any(
+                foreign_key.references(table_obj)
+                for column in table_obj.c for foreign_key in column.foreign_keys)
+            raw_conn = engine.raw_connection()
+            try:
+                cursor = raw_conn.cursor()
+                if self_referential:
+                    cursor.execute("SET foreign_key_checks = 0")
+                try:
+                    cursor.execute(command, (os.path.abspath(csvpath),))
+                    raw_conn.commit()
+                finally:
+                    if self_referential:
+                        # The connection goes back to the pool; don't leave
+                        # the checks off for whoever gets it next
+                        cursor.execute("SET foreign_key_checks = 1")
+            finally:
+                raw_conn.close()
+            stats.update(rows=cursor.rowcount, bytes=lines.size, commits=1)
+            return 'ok'
+
+        convert_row = _get_row_converter(table_obj, column_names)
+        rows = (convert_row(csvs) for csvs in reader)
+        progress = lines.progress
+        bytes_read = lambda: lines.position
+
+        if cache_dir is not None:
+            # Read the converted rows from the cache, building it first if
+            # it's missing or out of date
+            cachepath = os.path.join(cache_dir, table_name + '.cache')
+            sha1 = csv_hashes.get(csv_filename)
+            if sha1 is None:
+                sha1 = csv_hashes[csv_filename] = csvcache.hash_file(csvpath)
+            kinds = [csvcache.get_kind(table_obj.c[column_name])
+                     for column_name in column_names]
+            cache = csvcache.open_cache(cachepath, sha1, kinds)
+            if cache is None:
+                csvcache.build_cache(cachepath, sha1, column_names, kinds, rows)
+                cache = csvcache.open_cache(cachepath, sha1, kinds)
+            column_names = cache.column_names
+            rows = iter(cache)
+            progress = cache.progress
+            bytes_read = lambda: cache.size
+
+        # nb: Dictionaries flattened with ** have to have string keys
+        keys = [str(column_name) for column_name in column_names]
+
+        # Self-referential tables may contain rows with foreign keys of other
+        # rows in the same table that do not yet exist.  Put them in an order
+        # where they do.
+        self_ref_indexes = [
+            keys.index(column.name) for column in table_obj.c
+            if any(x.references(table_obj) for x in column.foreign_keys)]
+        if self_ref_indexes:
+            rows = _sort_self_referential_rows(rows, keys.index('id'),
+                                               self_ref_indexes)
+
+        if not safe and engine.dialect.name == 'sqlite':
+            # Skip SQLAlchemy and hand whole batches straight to the DBAPI
+            # cursor, and load the entire table in one transaction
+            preparer = engine.dialect.identifier_preparer
+            command = "INSERT INTO %s (%s) VALUES (%s)" % (
+                preparer.format_table(table_obj),
+                ','.join(preparer.quote(c) for c in column_names),
+                ','.join('?' for c in column_names),
+            )
+            cursor = session.connection().connection.cursor()
+            for batch in _iter_batches(rows, batch_size):
+                cursor.executemany(command, batch)
+                stats['rows'] += len(batch)
+                print_status(progress())
+            cursor.close()
+            session.commit()
+            stats.update(bytes=bytes_read(), commits=1)
+            if cache is None:
+                csv_hashes[csv_filename] = lines.hexdigest()
+            return 'ok'
+
+        # Remembering some zillion rows in the session consumes a lot of
+        # RAM.  Let's not do that.  Commit every batch
+        for batch in _iter_batches(rows, batch_size):
+            session.execute(insert_stmt, [dict(zip(keys, row)) for row in batch])
+            session.commit()
+            stats['rows'] += len(batch)
+            stats['commits'] += 1
+            print_status(progress())
+        stats['bytes'] = bytes_read()
+        if cache is None:
+            csv_hashes[csv_filename] = lines.hexdigest()
+    finally:
+        csvfile.close()
+        if cache is not None:
+            cache.close()
+
+    return 'ok'
+
+
+def _create_table_without_indexes(table, bind):
+    """Creates a table, but not its indexes.
+
+    Returns the indexes that were left out, to be created with
+    _create_indexes() once the table is filled.
+
+    CREATE TABLE itself never includes indexes; table.create() adds them
+    afterwards.  So this issues CREATE TABLE alone, rather than taking the
+    indexes off the shared table metadata, which other threads may be
+    using.  The table's create events still fire around it, the way
+    table.create() fires them: that's how types like PostgreSQL's ENUMs
+    get created first.
+    """
+    table.dispatch.before_create(table, bind, checkfirst=False,
+                                 _is_metadata_operation=False)
+    bind.execute(sqlalchemy.schema.CreateTable(table))
+    table.dispatch.after_create(table, bind, checkfirst=False,
+                                _is_metadata_operation=False)
+    return sorted(table.indexes, key=lambda index: index.name)
+
+
+def _create_indexes(engine, indexes, jobs, print_start, print_done):
+    """Creates the given indexes and reports how long each one took.
+
+    With more than one job, indexes are built in parallel by a pool of worker
+    threads, each with its own connection.
+    """
+    def create(index):
+        start = time.time()
+        index.create(bind=engine)
+        return index, time.time() - start
+
+    if jobs > 1:
+        pool = ThreadPool(jobs)
+        results = pool.imap_unordered(create, indexes)
+    else:
+        pool = None
+        results = (create(index) for index in indexes)
+
+    try:
+        for index, elapsed in results:
+            print_start('Index %s' % index.name)
+            print_done('%.2fs' % elapsed)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def _load_tables_parallel(engine, table_objs, load_table, jobs,
+                          print_start, print_done):
+    """Loads tables with a pool of `jobs` worker threads.
+
+    Tables are grouped into dependency levels, and each level is loaded
+    completely before the next one starts.  Every worker calls `load_table`
+    with its own session.
+    """
+    oracle = (engine.dialect.name == 'oracle')
+
+    def dummy(*args, **kwargs):
+        pass
+
+    def load_one(table_obj):
+        session = sqlalchemy.orm.Session(bind=engine)
+        try:
+            return table_obj, load_table(session, table_obj, dummy)
+        finally:
+            session.close()
+
+    pool = ThreadPool(jobs)
+    try:
+        for level in compute_dependency_levels(table_objs):
+            for table_obj, msg in pool.imap_unordered(load_one, level):
+                print_start(_get_csv_table_name(table_obj, oracle))
+                print_done(msg)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def load(session, tables=[], directory=None, drop_tables=False, verbose=False, safe=True, recursive=True, langs=None, jobs=1, incremental=False, batch_size=1000, profile=None, cache_dir=None):
     """Load data from CSV files into the given database session.
 
     Tables are created automatically.
@@ -126,13 +689,43 @@ def load(session, tables=[], directory=None, drop_tables=False, verbose=False, s
 
     `safe`
         If set to False, load can be faster, but can corrupt the database if
-        it crashes or is interrupted.
+        it crashes or is interrupted.  PostgreSQL and MySQL read the CSV
+        files themselves, with COPY and LOAD DATA LOCAL INFILE; for the
+        latter, connect with pokedex.db.connect(..., local_infile=True).
+        On SQLite, this turns off journaling and syncing, locks the database
+        for the duration of the load, and inserts every table in a single
+        transaction.
 
     `recursive`
         If set to True, load all dependent tables too.
 
     `langs`
         List of identifiers of extra language to load, or None to load them all
+
+    `jobs`
+        Number of tables to load at the same time, each over its own
+        connection.  Tables are only loaded after everything they depend on.
+        Ignored for SQLite, which can only have one writer.
+
+    `incremental`
+        If set to True, only tables whose CSV files changed since the last
+        load are dropped and reloaded, along with the tables that depend on
+        them.  Every load records the hashes of the CSV files it read, which
+        is what the changes are checked against.
+
+    `batch_size`
+        Number of rows to insert and commit at a time.
+
+    `profile`
+        Name of a file to write a JSON report to, with the wall time, rows,
+        bytes read, rows per second and commits of every phase of the load:
+        dropping and creating tables, inserting each table, regenerating
+        derived tables, translations, indexes and SQLite's integrity check.
+
+    `cache_dir`
+        Directory to keep a compiled cache of the CSV files in.  Tables and
+        translations are read from it instead of parsing the CSV files, and
+        each cache file is rebuilt whenever its CSV file changes.
     """
 
     # First take care of verbosity
@@ -159,11 +752,16 @@ def load(session, tables=[], directory=None, drop_tables=False, verbose=False, s
         rewrite_long_table_names()
 
     # SQLite speed tweaks
+    bulk_connection = None
     if not safe and engine.dialect.name == 'sqlite':
-        # We have to explicity call close here because session.execute
-        # returns a ResultProxy object that hangs onto the database cursor
-        # in case you wanted to see the results of your statement, and
-        # these PRAGMA commands helpfully return the string 'OFF'.
+        # The settings only last as long as the connection, and the session
+        # would normally get a fresh one after every commit.  So do the whole
+        # load over a single connection instead.
+        #
+        # We have to explicity call close here because execute returns a
+        # ResultProxy object that hangs onto the database cursor in case you
+        # wanted to see the results of your statement, and these PRAGMA
+        # commands helpfully return the string 'OFF'.
         #
         # This would not normally be a problem, except that when
         # journal_mode=OFF, SQLite sometimes doesn't like it when you
@@ -173,247 +771,408 @@ def load(session, tables=[], directory=None, drop_tables=False, verbose=False, s
         # will free the ResultProxy immediately because it isn't referenced,
         # closing the database cursor, but this isn't true in PyPy,
         # which doesn't use reference counting.
-        session.execute("PRAGMA synchronous=OFF").close()
-        session.execute("PRAGMA journal_mode=OFF").close()
-
-    # Drop all tables if requested
-    if drop_tables:
-        print_start('Dropping tables')
-        for n, table in enumerate(reversed(table_objs)):
-            table.drop(bind=engine, checkfirst=True)
-
-            # Drop columns' types if appropriate; needed for enums in
-            # postgresql
-            for column in table.c:
+        bulk_connection = engine.connect()
+        for pragma in _sqlite_bulk_pragmas:
+            bulk_connection.execute(pragma).close()
+        engine = bulk_connection
+        session = sqlalchemy.orm.Session(bind=bulk_connection)
+
+    load_profile = _LoadProfile(engine, safe=safe, jobs=jobs,
+                                batch_size=batch_size, incremental=incremental,
+                                cache_dir=cache_dir)
+
+    def finish():
+        if bulk_connection is not None:
+            session.close()
+            bulk_connection.execute("PRAGMA locking_mode=NORMAL").close()
+            bulk_connection.close()
+
+        if profile:
+            load_profile.write(profile)
+
+    # finish() puts the SQLite settings back even if the load fails, rather
+    # than leaving the database locked
+    try:
+        # Hashes of the CSV files are recorded after every load.  Only an
+        # incremental load needs them up front; otherwise the tables' files are
+        # hashed as they're read, and the rest once the load is done.
+        csv_hashes = {}
+        translation_files = _get_translation_filenames(directory, langs)
+        csv_hashes_table.create(bind=engine, checkfirst=True)
+
+        if incremental:
+            print_start('Checking for changed CSV files')
+            with load_profile.phase('check'):
+                csv_hashes = _get_csv_hashes(directory, [
+                    _get_csv_table_name(table, oracle) + '.csv'
+                    for table in table_objs] + translation_files)
+                table_objs = _find_changed_tables(session, table_objs, csv_hashes, oracle)
+            print_done('%s tables' % len(table_objs))
+            if not table_objs:
+                return
+            drop_tables = True
+
+        # Forget the hashes of anything we're about to replace, in case we crash
+        # halfway through.  They get recorded again once the load is done.
+        loaded_files = [_get_csv_table_name(table, oracle) + '.csv'
+                        for table in table_objs]
+        if _get_translation_tables() <= set(table_objs):
+            loaded_files.extend(translation_files)
+        csv_hashes = dict((filename, csv_hashes[filename])
+                          for filename in loaded_files if filename in csv_hashes)
+        session.execute(csv_hashes_table.delete().where(
+            csv_hashes_table.c.filename.in_(loaded_files)))
+        session.commit()
+
+        # Drop all tables if requested
+        if drop_tables:
+            with load_profile.phase('drop'):
+                print_start('Dropping tables')
+                for n, table in enumerate(reversed(table_objs)):
+                    table.drop(bind=engine, checkfirst=True)
+
+                    # Drop columns' types if appropriate; needed for enums in
+                    # postgresql
+                    for column in table.c:
+                        try:
+                            drop = column.type.drop
+                        except AttributeError:
+                            pass
+                        else:
+                            drop(bind=engine, checkfirst=True)
+
+                    print_status('%s/%s' % (n, len(table_objs)))
+                print_done()
+
+        # Indexes are created after all the data is in, instead of being updated
+        # with every insert
+        print_start('Creating tables')
+        deferred_indexes = []
+        with load_profile.phase('create'):
+            for n, table in enumerate(table_objs):
                 try:
-                    drop = column.type.drop
-                except AttributeError:
-                    pass
-                else:
-                    drop(bind=engine, checkfirst=True)
+                    deferred_indexes.extend(_create_table_without_indexes(table, engine))
+
+                # Exceptions for handling the error thrown when trying to load
+                # the database with a table that already exists.
+                except (
+                    sqlalchemy.exc.OperationalError,  # Exception used for SQLite
+                    sqlalchemy.exc.ProgrammingError,  # Exception used for PostgreSQL
+                    sqlalchemy.exc.InternalError      # Exception used for MySQL
+                    ) as error:
+
+                    if "already exists" in str(error.orig):
+                        print("\n\nERROR:  The table '{}' already exists in the database. "
+                            "Did you mean to use 'pokedex load -D'".format(table))
+                        sys.exit(1)
+
+                    # If it happens to be some other error but raised by the same
+                    # exception, then an unexpected error message is sent with
+                    # the error included
+                    else:
+                        print("\n\n UNEXPECTED ERROR: ", error)
+                        sys.exit(1)
 
-            print_status('%s/%s' % (n, len(table_objs)))
+                print_status('%s/%s' % (n, len(table_objs)))
         print_done()
 
-    print_start('Creating tables')
-    for n, table in enumerate(table_objs):
-        try:
-            table.create(bind=engine)
-
-        # Exceptions for handling the error thrown when trying to load
-        # the database with a table that already exists.
-        except (
-            sqlalchemy.exc.OperationalError,  # Exception used for SQLite
-            sqlalchemy.exc.ProgrammingError,  # Exception used for PostgreSQL
-            sqlalchemy.exc.InternalError      # Exception used for MySQL
-            ) as error:
-
-            if "already exists" in str(error.orig):
-                print("\n\nERROR:  The table '{}' already exists in the database. "
-                    "Did you mean to use 'pokedex load -D'".format(table))
-                sys.exit(1)
-
-            # If it happens to be some other error but raised by the same
-            # exception, then an unexpected error message is sent with
-            # the error included
-            else:
-                print("\n\n UNEXPECTED ERROR: ", error)
-                sys.exit(1)
-
-        print_status('%s/%s' % (n, len(table_objs)))
-    print_done()
-
-    # Okay, run through the tables and actually load the data now
-    for table_obj in table_objs:
-        if oracle:
-            table_name = table_obj._original_name
+        # Okay, run through the tables and actually load the data now
+        def load_table(session, table_obj, print_status):
+            table_name = _get_csv_table_name(table_obj, oracle)
+            with load_profile.phase('insert', table=table_name) as stats:
+                return _load_table(session, table_obj, print_status,
+                    directory=directory, safe=safe, oracle=oracle,
+                    batch_size=batch_size, stats=stats, cache_dir=cache_dir,
+                    csv_hashes=csv_hashes)
+
+        if jobs > 1 and engine.dialect.name != 'sqlite':
+            # SQLite only allows one writer at a time, so it always loads serially
+            _load_tables_parallel(engine, table_objs, load_table, jobs,
+                                  print_start, print_done)
         else:
-            table_name = table_obj.name
-
-        insert_stmt = table_obj.insert()
+            for table_obj in table_objs:
+                print_start(_get_csv_table_name(table_obj, oracle))
+                print_done(load_table(session, table_obj, print_status))
+
+        # Regenerate the tables that are computed from what was just loaded.
+        # That's table_objs, not the tables asked for: it includes dependent
+        # tables, and leaves out unchanged ones when loading incrementally.
+        loaded_names = [table.key for table in table_objs]
+        existing_names = set(sqlalchemy.inspect(engine).get_table_names())
+        for derived_table in derived.derived_tables:
+            table_obj = derived_table.table
+            if not derived_table.should_regenerate(loaded_names):
+                continue
+            if not all(table.name in existing_names
+                       for table in [table_obj] + derived_table.sources):
+                continue
+            print_start('Regenerating %s' % table_obj.name)
+            with load_profile.phase('derived', table=table_obj.name) as stats:
+                stats['rows'] = derived_table.regenerate(session)
+                session.commit()
+                stats['commits'] = 1
+            print_done()
 
-        print_start(table_name)
+        print_start('Translations')
+        transl = translations.Translations(csv_directory=directory,
+                                           cache_dir=cache_dir)
 
-        try:
-            csvpath = "%s/%s.csv" % (directory, table_name)
-            if six.PY2:
-                csvfile = open(csvpath, 'r')
+        with load_profile.phase('translations') as stats:
+            # Only read the translation files if anything they go into is loaded
+            if _get_translation_tables() & set(table_objs):
+                load_data = transl.get_load_data(langs, batch_size=batch_size,
+                                                 jobs=jobs)
             else:
-                csvfile = open(csvpath, 'r', encoding="utf8")
-        except IOError:
-            # File doesn't exist; don't load anything!
-            print_done('missing?')
-            continue
-
-        # XXX This is wrong for files with multi-line fields, but Python 3
-        # doesn't allow .tell() on a file that's currently being iterated
-        # (because the result is completely bogus).  Oh well.
-        csvsize = sum(1 for line in csvfile)
-        csvfile.seek(0)
-
-        reader = csv.reader(csvfile, lineterminator='\n')
-        column_names = [six.text_type(column) for column in next(reader)]
+                load_data = []
+            for translation_class, rows in load_data:
+                table_obj = translation_class.__table__
+                if table_obj in table_objs:
+                    insert_stmt = table_obj.insert()
+                    session.execute(insert_stmt, rows)
+                    session.commit()
+                    stats['commits'] += 1
+                    # We don't have a total, but at least show some increasing number
+                    stats['rows'] += len(rows)
+                    print_status(str(stats['rows']))
+            if load_data:
+                for filename in loaded_files:
+                    if filename.startswith('translations/'):
+                        path = os.path.join(directory, filename)
+                        if os.path.exists(path):
+                            stats['bytes'] += os.path.getsize(path)
 
-        if not safe and engine.dialect.name == 'postgresql':
-            # Postgres' CSV dialect works with our data, if we mark the not-null
-            # columns with FORCE NOT NULL.
-            not_null_cols = [c for c in column_names if not table_obj.c[c].nullable]
-            if not_null_cols:
-                force_not_null = 'FORCE NOT NULL ' + ','.join('"%s"' % c for c in not_null_cols)
+        print_done()
+
+        with load_profile.phase('indexes'):
+            # SQLite can only have one writer, so it builds them one at a time
+            if engine.dialect.name == 'sqlite':
+                index_jobs = 1
             else:
-                force_not_null = ''
+                index_jobs = jobs
+            _create_indexes(engine, deferred_indexes, index_jobs,
+                            print_start, print_done)
+
+        # SQLite check
+        if engine.dialect.name == 'sqlite':
+            with load_profile.phase('integrity_check'):
+                session.execute("PRAGMA integrity_check").close()
+
+        for filename in loaded_files:
+            if filename not in csv_hashes:
+                csv_hashes[filename] = csvcache.hash_file(
+                    os.path.join(directory, filename))
+        _record_csv_hashes(session, csv_hashes)
+
+    finally:
+        finish()
+
+
+def _get_relationship_indexes():
+    """Returns indexes for the columns that ORM relationships look rows up
+    by, other than those that some index or primary key already covers.
+
+    One-to-many and many-to-many relationships find rows by their foreign
+    key, plus any other columns of the same table in the join condition
+    (e.g. `local_language_id` for `names_local`), and sort them by their
+    `order_by`.  The index has all of those columns, so the lookup and the
+    sort can both be done from the index alone.
+    """
+    sqlalchemy.orm.configure_mappers()
+
+    def is_covered(table, columns):
+        existing = [list(table.primary_key.columns)]
+        existing.extend(list(index.columns) for index in table.indexes)
+        return any(columns == index_columns[:len(columns)]
+                   for index_columns in existing)
+
+    indexes = {}
+    for table_class in t.mapped_classes:
+        parent_table = table_class.__table__
+        for prop in sqlalchemy.inspect(table_class).relationships:
+            if prop.direction is sqlalchemy.orm.interfaces.MANYTOONE:
+                # Looked up by primary key
+                continue
+
+            condition_columns = []
+            sqlalchemy.sql.visitors.traverse(prop.primaryjoin, {},
+                {'column': condition_columns.append})
+            join_columns = ([remote for local, remote in prop.local_remote_pairs] +
+                sorted(condition_columns, key=lambda column: column.name))
+
+            columns_by_table = {}
+            for column in join_columns:
+                table = column.table
+                if table is parent_table or table not in metadata.tables.values():
+                    continue
+                columns = columns_by_table.setdefault(table, [])
+                if column not in columns:
+                    columns.append(column)
+
+            for table, columns in columns_by_table.items():
+                for order_by in prop.order_by or ():
+                    order_column = getattr(order_by, 'element', order_by)
+                    if (getattr(order_column, 'table', None) is table and
+                            order_column not in columns):
+                        columns.append(order_column)
+                key = tuple(column.name for column in columns)
+                if (table.name, key) in indexes or is_covered(table, columns):
+                    continue
+                index = sqlalchemy.Index(
+                    'ix_%s_%s' % (table.name, '_'.join(key)), *columns)
+                # Don't make it part of the schema that load() creates
+                table.indexes.discard(index)
+                indexes[table.name, key] = index
 
-            # Grab the underlying psycopg2 cursor so we can use COPY FROM STDIN
-            raw_conn = engine.raw_connection()
-            command = "COPY %(table_name)s (%(columns)s) FROM STDIN CSV HEADER %(force_not_null)s"
-            csvfile.seek(0)
-            raw_conn.cursor().copy_expert(
-                command % dict(
-                    table_name=table_name,
-                    columns=','.join('"%s"' % c for c in column_names),
-                    force_not_null=force_not_null,
-                ),
-                csvfile,
-            )
-            raw_conn.commit()
-            print_done()
-            continue
+    return [indexes[key] for key in sorted(indexes)]
 
-        # Self-referential tables may contain rows with foreign keys of other
-        # rows in the same table that do not yet exist.  Pull these out and
-        # insert them last
-        # ASSUMPTION: Self-referential tables have a single PK called "id"
-        deferred_rows = []  # ( row referring to id, [foreign ids we need] )
-        seen_ids = set()    # primary keys we've seen
-
-        # Fetch foreign key columns that point at this table, if any
-        self_ref_columns = []
-        for column in table_obj.c:
-            if any(x.references(table_obj) for x in column.foreign_keys):
-                self_ref_columns.append(column)
-
-        new_rows = []
-        def insert_and_commit():
-            if not new_rows:
-                return
-            session.execute(insert_stmt, new_rows)
-            session.commit()
-            new_rows[:] = []
 
-            progress = "%d%%" % (100 * csvpos // csvsize)
-            print_status(progress)
+def build_sqlite(path, directory=None, verbose=False, langs=None,
+                 cache_dir=None, tables=[], page_size=8192):
+    """Builds a SQLite database at `path` that's optimized for reading.
 
-        csvpos = 0
-        for csvs in reader:
-            csvpos += 1
-            row_data = {}
+    The data is loaded into a new file, which gets indexes for every lookup
+    the ORM relationships do, `ANALYZE` statistics, a page size of
+    `page_size` and rollback journaling instead of WAL, and is then
+    `VACUUM`ed.  Once that's done, it replaces whatever is at `path`.
 
-            for column_name, value in zip(column_names, csvs):
-                column = table_obj.c[column_name]
-                if column.nullable and value == '':
-                    # Empty string in a nullable column really means NULL
-                    value = None
-                elif isinstance(column.type, sqlalchemy.types.Boolean):
-                    # Boolean values are stored as string values 0/1, but both
-                    # of those evaluate as true; SQLA wants True/False
-                    if value == '0':
-                        value = False
-                    else:
-                        value = True
-                elif isinstance(value, bytes):
-                    # Otherwise, unflatten from bytes
-                    value = value.decode('utf-8')
-
-                # nb: Dictionaries flattened with ** have to have string keys
-                row_data[ str(column_name) ] = value
-
-            # May need to stash this row and add it later if it refers to a
-            # later row in this table
-            if self_ref_columns:
-                foreign_ids = set(row_data[x.name] for x in self_ref_columns)
-                foreign_ids.discard(None)  # remove NULL ids
-
-                if not foreign_ids:
-                    # NULL key.  Remember this row and add as usual.
-                    seen_ids.add(row_data['id'])
-
-                elif foreign_ids.issubset(seen_ids):
-                    # Non-NULL key we've already seen.  Remember it and commit
-                    # so we know the old row exists when we add the new one
-                    insert_and_commit()
-                    seen_ids.add(row_data['id'])
-
-                else:
-                    # Non-NULL future id.  Save this and insert it later!
-                    deferred_rows.append((row_data, foreign_ids))
-                    continue
+    Open it with `pokedex.db.connect(uri, read_only=True)`, which many
+    processes can do at the same time without any locking.
 
-            # Insert row!
-            new_rows.append(row_data)
+    `directory`, `verbose`, `langs`, `cache_dir` and `tables` are passed on
+    to `load`.
+    """
+    print_start, print_status, print_done = _get_verbose_prints(verbose)
 
-            # Remembering some zillion rows in the session consumes a lot of
-            # RAM.  Let's not do that.  Commit every 1000 rows
-            if len(new_rows) >= 1000:
-                insert_and_commit()
+    temp_path = path + '.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    engine = sqlalchemy.create_engine('sqlite:///' + temp_path)
+    session = sqlalchemy.orm.Session(bind=engine)
+    load(session, tables=tables, directory=directory, verbose=verbose,
+         safe=False, langs=langs, cache_dir=cache_dir)
+    session.close()
+
+    connection = engine.connect()
+    try:
+        # Only index tables that were loaded
+        existing_names = set(sqlalchemy.inspect(connection).get_table_names())
+        for index in _get_relationship_indexes():
+            if index.table.name in existing_names:
+                print_start('Index %s' % index.name)
+                index.create(bind=connection)
+                print_done()
+
+        print_start('Optimizing')
+        connection.execute("ANALYZE").close()
+        connection.execute("PRAGMA journal_mode=DELETE").close()
+        # The new page size only takes effect once the database is vacuumed
+        connection.execute("PRAGMA page_size=%d" % page_size).close()
+        connection.execute("VACUUM").close()
+        print_done()
+    finally:
+        connection.close()
+        engine.dispose()
 
-        insert_and_commit()
+    getattr(os, 'replace', os.rename)(temp_path, path)
 
-        # Attempt to add any spare rows we've collected
-        for row_data, foreign_ids in deferred_rows:
-            if not foreign_ids.issubset(seen_ids):
-                # Could happen if row A refers to B which refers to C.
-                # This is ridiculous and doesn't happen in my data so far
-                raise ValueError("Too many levels of self-reference!  "
-                                 "Row was: " + str(row_data))
 
-            session.execute(
-                insert_stmt.values(**row_data)
-            )
-            seen_ids.add(row_data['id'])
+def _get_dump_formatter(column):
+    """Returns a function that turns a value from `column` into a string for
+    a CSV file.
+    """
+    # Convert Pythony values to something more universal
+    if isinstance(column.type, sqlalchemy.types.Boolean):
+        def format(value):
+            if value is None:
+                return ''
+            elif value:
+                return '1'
+            else:
+                return '0'
+    elif six.PY3:
+        def format(value):
+            if value is None:
+                return ''
+            return six.text_type(value)
+    else:
+        def format(value):
+            if value is None:
+                return ''
+            return six.text_type(value).encode('utf8')
+    return format
 
-        session.commit()
-        print_done()
 
-    VGPMM = t.VersionGroupPokemonMoveMethod
-    if VGPMM.__tablename__ in table_names or t.PokemonMove.__tablename__ in table_names:
-        print_start('Regenerating %s' % VGPMM.__tablename__)
-
-        session.query(VGPMM).delete()
-
-        q = session.query(t.VersionGroup.id, t.PokemonMoveMethod.id)
-        q = q.filter(exists().where(and_(
-                t.PokemonMove.pokemon_move_method_id == t.PokemonMoveMethod.id,
-                t.PokemonMove.version_group_id == t.VersionGroup.id)))
-        for version_group_id, pokemon_move_method_id in q:
-            session.add(VGPMM(
-                    version_group_id=version_group_id,
-                    pokemon_move_method_id=pokemon_move_method_id,
-            ))
-        session.commit()
-        print_done()
+def _dump_table(connection, table, filename, language_ids, print_status,
+                batch_size=1000):
+    """Dumps one table to a CSV file.
 
-    print_start('Translations')
-    transl = translations.Translations(csv_directory=directory)
+    Rows are streamed from the database as plain tuples, and only rows for
+    the languages in `language_ids` are dumped, unless it is None.
+    """
+    # CSV module only works with bytes on 2 and only works with text on 3!
+    if six.PY3:
+        csvfile = open(filename, 'w', newline='', encoding="utf8")
+        columns = [col.name for col in table.columns]
+    else:
+        csvfile = open(filename, 'wb')
+        columns = [col.name.encode('utf8') for col in table.columns]
 
-    new_row_count = 0
-    for translation_class, rows in transl.get_load_data(langs):
-        table_obj = translation_class.__table__
-        if table_obj in table_objs:
-            insert_stmt = table_obj.insert()
-            session.execute(insert_stmt, rows)
-            session.commit()
-            # We don't have a total, but at least show some increasing number
-            new_row_count += len(rows)
-            print_status(str(new_row_count))
+    formatters = [_get_dump_formatter(col) for col in table.columns]
+
+    query = sqlalchemy.select([table]).order_by(*table.primary_key)
+    if language_ids is not None:
+        query = query.where(
+            table.c.local_language_id.in_(sorted(language_ids))
+            if language_ids else sqlalchemy.sql.false())
+    result = connection.execution_options(stream_results=True).execute(query)
+
+    with csvfile:
+        writer = csv.writer(csvfile, lineterminator='\n')
+        writer.writerow(columns)
 
-    # SQLite check
-    if engine.dialect.name == 'sqlite':
-        session.execute("PRAGMA integrity_check")
+        row_count = 0
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            writer.writerows(
+                [format(value) for format, value in zip(formatters, row)]
+                for row in rows)
+            row_count += len(rows)
+            print_status(str(row_count))
 
-    print_done()
+    result.close()
+    return 'ok'
 
 
-def dump(session, tables=[], directory=None, verbose=False, langs=None):
+def _dump_tables_parallel(engine, table_names, dump_table, jobs,
+                          print_start, print_done):
+    """Dumps tables with a pool of `jobs` worker threads.
+
+    Every worker calls `dump_table` with its own connection, the name of the
+    table, and a print_status function; it returns the table name and a
+    message to show.
+    """
+    def dump_with_own_connection(table_name):
+        connection = engine.connect()
+        try:
+            return dump_table(connection, table_name, lambda msg: None)
+        finally:
+            connection.close()
+
+    pool = ThreadPool(jobs)
+    try:
+        for table_name, msg in pool.imap_unordered(
+                dump_with_own_connection, table_names):
+            print_start(table_name)
+            print_done(msg)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def dump(session, tables=[], directory=None, verbose=False, langs=None, jobs=1):
     """Dumps the contents of a database to a set of CSV files.  Probably not
     useful to anyone besides a developer.
 
@@ -432,12 +1191,16 @@ def dump(session, tables=[], directory=None, verbose=False, langs=None):
 
     `langs`
         List of identifiers of languages to dump unofficial texts for
+
+    `jobs`
+        Number of tables to dump at the same time, each over its own
+        connection.  Ignored for SQLite.
     """
 
     # First take care of verbosity
     print_start, print_status, print_done = _get_verbose_prints(verbose)
 
-    languages = dict((l.id, l) for l in session.query(pokedex.db.tables.Language))
+    languages = list(session.query(pokedex.db.tables.Language))
 
     if not directory:
         directory = get_default_csv_dir()
@@ -447,72 +1210,39 @@ def dump(session, tables=[], directory=None, verbose=False, langs=None):
 
     # Oracle needs to dump from tables with shortened names to csvs with the
     # usual names
-    oracle = (session.connection().dialect.name == 'oracle')
+    engine = session.get_bind()
+    oracle = (engine.dialect.name == 'oracle')
     if oracle:
         rewrite_long_table_names()
 
-    for table_name in table_names:
-        print_start(table_name)
-        table = metadata.tables[table_name]
-
-        if oracle:
-            filename = '%s/%s.csv' % (directory, table._original_name)
-        else:
-            filename = '%s/%s.csv' % (directory, table_name)
-
-        # CSV module only works with bytes on 2 and only works with text on 3!
-        if six.PY3:
-            csvfile = open(filename, 'w', newline='', encoding="utf8")
-            writer = csv.writer(csvfile, lineterminator='\n')
-            columns = [col.name for col in table.columns]
-        else:
-            csvfile = open(filename, 'wb')
-            writer = csv.writer(csvfile, lineterminator='\n')
-            columns = [col.name.encode('utf8') for col in table.columns]
-
+    def get_language_ids(table):
         # For name tables, always dump rows for official languages, as well as
         # for those in `langs` if specified.
         # For other translation tables, only dump rows for languages in `langs`
         # if specified, or for official languages by default.
         # For non-translation tables, dump all rows.
-        if 'local_language_id' in columns:
-            if langs is None:
-                def include_row(row):
-                    return languages[row.local_language_id].official
-            elif any(col.info.get('official') for col in table.columns):
-                def include_row(row):
-                    return (languages[row.local_language_id].official or
-                            languages[row.local_language_id].identifier in langs)
-            else:
-                def include_row(row):
-                    return languages[row.local_language_id].identifier in langs
+        if 'local_language_id' not in table.c:
+            return None
+        elif langs is None:
+            return set(l.id for l in languages if l.official)
+        elif any(col.info.get('official') for col in table.columns):
+            return set(l.id for l in languages
+                       if l.official or l.identifier in langs)
         else:
-            def include_row(row):
-                return True
-
-        writer.writerow(columns)
-
-        primary_key = table.primary_key
-        for row in session.query(table).order_by(*primary_key).all():
-            if include_row(row):
-                csvs = []
-                for col in columns:
-                    # Convert Pythony values to something more universal
-                    val = getattr(row, col)
-                    if val == None:
-                        val = ''
-                    elif val == True:
-                        val = '1'
-                    elif val == False:
-                        val = '0'
-                    else:
-                        val = six.text_type(val)
-                        if not six.PY3:
-                            val = val.encode('utf8')
-
-                    csvs.append(val)
+            return set(l.id for l in languages if l.identifier in langs)
 
-                writer.writerow(csvs)
-
-        csvfile.close()
-        print_done()
+    def dump_one(connection, table_name, print_status):
+        table = metadata.tables[table_name]
+        filename = '%s/%s.csv' % (directory,
+                                  _get_csv_table_name(table, oracle))
+        return table_name, _dump_table(connection, table, filename,
+                                       get_language_ids(table), print_status)
+
+    if jobs > 1 and engine.dialect.name != 'sqlite':
+        _dump_tables_parallel(engine, table_names, dump_one, jobs,
+                              print_start, print_done)
+    else:
+        connection = session.connection()
+        for table_name in table_names:
+            print_start(table_name)
+            print_done(dump_one(connection, table_name, print_status)[1])
@@ -28,12 +28,13 @@ import csv
 import io
 import os
 import re
+import threading
 from collections import defaultdict
 
 import six
-from six.moves import zip
+from six.moves import queue, zip
 
-from pokedex.db import tables
+from pokedex.db import csvcache, tables
 from pokedex.defaults import get_default_csv_dir
 
 default_source_lang = 'en'
@@ -62,6 +63,10 @@ for cls in tables.mapped_classes:
     else:
         summary_map.setdefault(summary_class, {})[col] = cls
 
+# Kinds of the columns of a translation CSV file, for caching it
+translation_csv_kinds = [csvcache.INTEGER, csvcache.TEXT, csvcache.INTEGER,
+                         csvcache.TEXT, csvcache.TEXT, csvcache.TEXT]
+
 number_re = re.compile("[0-9]+")
 
 def crc(string):
@@ -167,7 +172,7 @@ class Message(object):
 class Translations(object):
     """Data and opertaions specific to a location on disk (and a source language)
     """
-    def __init__(self, source_lang=default_source_lang, csv_directory=None, translation_directory=None):
+    def __init__(self, source_lang=default_source_lang, csv_directory=None, translation_directory=None, cache_dir=None):
         if csv_directory is None:
             csv_directory = get_default_csv_dir()
 
@@ -177,6 +182,7 @@ class Translations(object):
         self.source_lang = default_source_lang
         self.csv_directory = csv_directory
         self.translation_directory = translation_directory
+        self.cache_dir = cache_dir
 
         self.language_ids = {}
         self.language_identifiers = {}
@@ -308,8 +314,13 @@ class Translations(object):
 
     def yield_target_messages(self, lang):
         """Yield messages from the data/csv/translations/<lang>.csv file
+
+        With a cache_dir, they're read from a compiled cache of the file
+        instead (see pokedex.db.csvcache).
         """
         path = os.path.join(self.csv_directory, 'translations', '%s.csv' % lang)
+        if self.cache_dir is not None:
+            return self._yield_cached_target_messages(lang, path)
         try:
             if six.PY2:
                 file = open(path, 'r')
@@ -319,57 +330,151 @@ class Translations(object):
             return ()
         return yield_translation_csv_messages(file)
 
+    def _yield_cached_target_messages(self, lang, path):
+        sha1 = csvcache.hash_file(path)
+        if sha1 is None:
+            return
+        cachepath = os.path.join(self.cache_dir, 'translations', '%s.cache' % lang)
+        cache = csvcache.open_cache(cachepath, sha1, translation_csv_kinds)
+        if cache is None:
+            if six.PY2:
+                file = open(path, 'r')
+            else:
+                file = open(path, 'r', encoding="utf8")
+            with file:
+                csvreader = csv.reader(file, lineterminator='\n')
+                columns = next(csvreader)
+                rows = ((int(language_id), table, int(id), column, source_crc,
+                         string.decode('utf-8') if six.PY2 else string)
+                        for language_id, table, id, column, source_crc, string
+                        in csvreader)
+                csvcache.build_cache(cachepath, sha1, columns,
+                                     translation_csv_kinds, rows)
+            cache = csvcache.open_cache(cachepath, sha1, translation_csv_kinds)
+        with cache:
+            for language_id, table, id, column, source_crc, string in cache:
+                yield Message(
+                        table,
+                        id,
+                        column,
+                        string,
+                        origin='target CSV',
+                        source_crc=source_crc,
+                        language_id=language_id,
+                    )
+
     def yield_all_translations(self):
         stream = Merge()
         for lang in self.language_identifiers.values():
             stream.add_iterator(self.yield_target_messages(lang))
         return (message for message in stream if not message.official)
 
-    def get_load_data(self, langs=None):
+    def get_load_data(self, langs=None, batch_size=1000, jobs=1):
         """Yield (translation_class, data for INSERT) pairs for loading into the DB
 
-        langs is either a list of language identifiers or None
+        langs is either a list of language identifiers or None.  Only the
+        translation files of those languages are read.
+
+        The data comes in lists of at most batch_size rows.  With jobs > 1,
+        that many languages are read at the same time, by worker threads.
         """
         if langs is None:
             langs = self.language_identifiers.values()
-        stream = Merge()
-        for lang in self.language_identifiers.values():
-            stream.add_iterator(self.yield_target_messages(lang))
+        langs = [lang for lang in self.language_identifiers.values()
+                 if lang in langs]
+        if jobs > 1 and len(langs) > 1:
+            return self._get_load_data_parallel(langs, batch_size, jobs)
+        return (item for lang in langs
+                for item in self.get_lang_load_data(lang, batch_size))
+
+    def get_lang_load_data(self, lang, batch_size=1000):
+        """Yield (translation_class, data for INSERT) pairs for one language
+
+        Rows are collected per translation class, and yielded as soon as
+        batch_size of them are ready.
+        """
+        stream = self.yield_target_messages(lang)
         stream = (message for message in stream if not message.official)
-        count = 0
-        class GroupDict(dict):
-            """Dict to automatically set the foreign_id and local_language_id for new items
-            """
-            def __missing__(self, key):
-                # depends on `cls` from outside scope
-                id, language_id = key
-                data = self[key] = defaultdict(lambda: None)
-                column_names = (c.name for c in translation_class.__table__.columns)
-                data.update(dict.fromkeys(column_names))
-                data.update({
-                        '%s_id' % cls.__singlename__: id,
-                        'local_language_id': language_id,
-                    })
-                return data
-        # Nested dict:
-        # translation_class -> (lang, id) -> column -> value
-        everything = defaultdict(GroupDict)
+        batches = defaultdict(list)
         # Group by object so we always have all of the messages for one DB row
         for (cls_name, id), group in group_by_object(stream):
             cls = toplevel_class_by_name[cls_name]
+            rows = {}
             for message in group:
                 translation_class = translation_class_by_column[cls, message.colname]
-                key = id, message.language_id
-                colname = str(message.colname)
-                everything[translation_class][key][colname] = message.string
-                count += 1
-            if count > 1000:
-                for translation_class, key_data in everything.items():
-                    yield translation_class, list(key_data.values())
-                count = 0
-                everything.clear()
-        for translation_class, data_dict in everything.items():
-            yield translation_class, list(data_dict.values())
+                key = translation_class, message.language_id
+                try:
+                    row = rows[key]
+                except KeyError:
+                    column_names = (c.name for c in translation_class.__table__.columns)
+                    row = rows[key] = dict.fromkeys(column_names)
+                    row.update({
+                            '%s_id' % cls.__singlename__: id,
+                            'local_language_id': message.language_id,
+                        })
+                row[str(message.colname)] = message.string
+            for (translation_class, language_id), row in rows.items():
+                batch = batches[translation_class]
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    yield translation_class, batch
+                    batches[translation_class] = []
+        for translation_class, batch in batches.items():
+            if batch:
+                yield translation_class, batch
+
+    def _get_load_data_parallel(self, langs, batch_size, jobs):
+        """get_load_data with a thread per language, up to jobs at a time
+
+        Workers hand their batches over through a bounded queue, so they
+        never get far ahead of whoever is inserting the data.
+        """
+        pending_langs = queue.Queue()
+        for lang in langs:
+            pending_langs.put(lang)
+        results = queue.Queue(maxsize=jobs * 2)
+        stop = threading.Event()
+
+        def work():
+            try:
+                while not stop.is_set():
+                    try:
+                        lang = pending_langs.get_nowait()
+                    except queue.Empty:
+                        break
+                    for item in self.get_lang_load_data(lang, batch_size):
+                        if stop.is_set():
+                            break
+                        results.put(('data', item))
+            except Exception as error:
+                results.put(('error', error))
+            finally:
+                results.put(('done', None))
+
+        threads = [threading.Thread(target=work)
+                   for n in range(min(jobs, len(langs)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            running = len(threads)
+            while running:
+                kind, value = results.get()
+                if kind == 'data':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    running -= 1
+        finally:
+            # Unblock any workers still waiting to hand over a batch
+            stop.set()
+            while any(thread.is_alive() for thread in threads):
+                try:
+                    results.get(timeout=0.1)
+                except queue.Empty:
+                    pass
 
 def group_by_object(stream):
     """Group stream by object
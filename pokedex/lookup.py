@@ -1,30 +1,44 @@
 # encoding: utf8
+import array
+import bisect
+import collections
+import contextlib
+import multiprocessing
 import os, os.path
 import random
 import re
+import threading
+import time
 import unicodedata
 
 from six import text_type
 import whoosh
+import whoosh.columns
 import whoosh.index
 import whoosh.query
 import whoosh.sorting
 from whoosh.support import levenshtein
 
 from pokedex.compatibility import namedtuple
+from pokedex import nameindex
 
 from pokedex.db import connect
+from pokedex.db.load import _get_verbose_prints
 import pokedex.db.tables as tables
 from pokedex.roomaji import romanize
 from pokedex.defaults import get_default_index_dir
 
-__all__ = ['PokedexLookup']
+__all__ = ['PokedexLookup', 'ResultCache', 'SearcherPool']
 
 
 LookupResult = namedtuple('LookupResult', [
     'object', 'indexed_name', 'name', 'language', 'iso639', 'iso3166', 'exact',
 ])
 
+Completion = namedtuple('Completion', [
+    'name', 'indexed_name', 'table', 'id', 'language', 'iso639', 'iso3166',
+])
+
 class UninitializedIndex(object):
     class UninitializedIndexError(Exception):
         pass
@@ -43,6 +57,34 @@ class UninitializedIndex(object):
             "or lookup.rebuild_index() to create it."
         )
 
+def _language_weight(name, language, locale_ident, extra_weights={}):
+    """Returns how strongly to prefer a result named `name` in `language`.
+
+    See LanguageFacet.
+    """
+    weight = extra_weights.get(name, 1.0)
+
+    if language == locale_ident:
+        # Bump up names in the current locale
+        weight *= 2.0
+    elif language == u'roomaji':
+        # Given that the Japanese names are the originals, it seems likely
+        # that basically anyone might want to look them up.  Boost them a
+        # little bit.
+        weight *= 1.4
+
+    return weight
+
+def _language_groups(identifiers, locale_ident):
+    """Groups the language `identifiers` by how strongly _language_weight()
+    prefers them.  Returns a list of sets, most preferred first.
+    """
+    weights = {}
+    for identifier in identifiers:
+        weight = _language_weight(None, identifier, locale_ident)
+        weights.setdefault(weight, set()).add(identifier)
+    return [weights[weight] for weight in sorted(weights, reverse=True)]
+
 def LanguageFacet(locale_ident, extra_weights={}):
     """Constructs a sorting function that bubbles results from the current
     locale (given by `locale_ident`) to the top of the list.
@@ -50,27 +92,29 @@ def LanguageFacet(locale_ident, extra_weights={}):
     `extra_weights` may be a dictionary of weights which will be factored in.
     Intended for use with spelling corrections, which come along with their own
     weightings.
+
+    This runs for every matching document; boost_languages() does the same
+    for just the hits that are kept.
     """
     def score(searcher, docnum):
         doc = searcher.stored_fields(docnum)
-        weight = extra_weights.get(doc['name'], 1.0)
-
-        doc_language = doc['language']
-        if doc_language == locale_ident:
-            # Bump up names in the current locale
-            weight *= 2.0
-        elif doc_language == u'roomaji':
-            # Given that the Japanese names are the originals, it seems likely
-            # that basically anyone might want to look them up.  Boost them a
-            # little bit.
-            weight *= 1.4
 
         # Higher weights should come FIRST, but sorts are ascending.  Negate
         # the weight to fix this
-        return -weight
+        return -_language_weight(doc['name'], doc['language'], locale_ident,
+                                 extra_weights)
 
     return whoosh.sorting.FunctionFacet(score)
 
+def boost_languages(hits, locale_ident, extra_weights={}):
+    """Sorts hits so the ones that LanguageFacet would prefer come first.
+
+    The sort is stable, so hits that weigh the same stay in the order they
+    came in.
+    """
+    return sorted(hits, key=lambda hit: -_language_weight(
+        hit['name'], hit['language'], locale_ident, extra_weights))
+
 _table_order = dict(
     pokemon_species=1,
     pokemon_forms=1,
@@ -93,10 +137,207 @@ def _table_facet_impl(searcher, docnum):
 table_facet = whoosh.sorting.FunctionFacet(_table_facet_impl)
 
 
+def normalize_name(name):
+    """Strips irrelevant formatting junk from name input.
+
+    Specifically: everything is lowercased, and accents are removed.
+    """
+    # http://stackoverflow.com/questions/517923/what-is-the-best-way-to-remove-accents-in-a-python-unicode-string
+    # Makes sense to me.  Decompose by Unicode rules, then remove combining
+    # characters, then recombine.  I'm explicitly doing it this way instead
+    # of testing combining() because Korean characters apparently
+    # decompose!  But the results are considered letters, not combining
+    # characters, so testing for Mn works well, and combining them again
+    # makes them look right.
+    nkfd_form = unicodedata.normalize('NFKD', text_type(name))
+    name = u"".join(c for c in nkfd_form
+                    if unicodedata.category(c) != 'Mn')
+    name = unicodedata.normalize('NFC', name)
+
+    name = name.strip()
+    name = name.lower()
+
+    return name
+
+def _make_documents(args):
+    """Makes the index documents for a chunk of names from one table.
+
+    `args` is `(table_name, rows)`, where each row is `(row_id, name,
+    language identifier, iso639, iso3166)`.  This runs in rebuild_index()'s
+    worker processes, so it has to be a plain function.
+    """
+    table_name, rows = args
+    documents = []
+    for row_id, name, language, iso639, iso3166 in rows:
+        if not name:
+            continue
+
+        names = [name]
+        # Add generated Roomaji too
+        # XXX this should be a first-class concept, not
+        # piggybacking on Japanese
+        if language == 'ja-Hrkt':
+            names.append(romanize(name))
+
+        for name in names:
+            documents.append(dict(
+                name=normalize_name(name), display_name=name,
+                language=language, iso639=iso639, iso3166=iso3166,
+                table=text_type(table_name), row_id=text_type(row_id),
+            ))
+    return documents
+
+
+class SearcherPool(object):
+    """A pool of whoosh searchers that are reused from one lookup to the next.
+
+    Opening a searcher opens every segment of the index, so it's worth
+    keeping them around.  A searcher can only be used by one thread at a
+    time, though, so each lookup takes one out of the pool with `acquire()`
+    and puts it back with `release()`.
+
+    Searchers are refreshed when they're taken out if the index has a new
+    generation, whether `rebuild_index()` or another process changed it.
+
+    `opened` and `refreshed` count how many searchers were opened and
+    refreshed over the pool's lifetime.
+    """
+    def __init__(self, index, max_idle=8):
+        self.index = index
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.idle = []
+        # Searchers that are in use => the index they were opened for
+        self.in_use = {}
+        self.opened = 0
+        self.refreshed = 0
+
+    def acquire(self):
+        """Returns an up-to-date searcher for the exclusive use of the
+        caller.
+        """
+        with self.lock:
+            index = self.index
+            searcher = self.idle.pop() if self.idle else None
+
+        if searcher is None:
+            searcher = index.searcher()
+            opened, refreshed = 1, 0
+        elif not searcher.up_to_date():
+            searcher = searcher.refresh()
+            opened, refreshed = 0, 1
+        else:
+            opened, refreshed = 0, 0
+
+        with self.lock:
+            self.in_use[searcher] = index
+            self.opened += opened
+            self.refreshed += refreshed
+        return searcher
+
+    def release(self, searcher):
+        """Puts a searcher from `acquire()` back in the pool."""
+        with self.lock:
+            index = self.in_use.pop(searcher)
+            if index is self.index and len(self.idle) < self.max_idle:
+                self.idle.append(searcher)
+                return
+        # Surplus, or from an index that has since been replaced
+        searcher.close()
+
+    @contextlib.contextmanager
+    def searcher(self):
+        """Context manager that acquires and releases a searcher."""
+        searcher = self.acquire()
+        try:
+            yield searcher
+        finally:
+            self.release(searcher)
+
+    def reset(self, index):
+        """Switches the pool to a new index and closes the idle searchers.
+        Searchers that are in use are closed once they're released.
+        """
+        with self.lock:
+            idle = self.idle
+            self.idle = []
+            self.index = index
+        for searcher in idle:
+            searcher.close()
+
+    def stats(self):
+        """Returns a dict of counts of searchers opened and refreshed so far,
+        and of those idle and in use right now.
+        """
+        with self.lock:
+            return dict(opened=self.opened, refreshed=self.refreshed,
+                        idle=len(self.idle), in_use=len(self.in_use))
+
+
+class ResultCache(object):
+    """A bounded cache of what lookups found, shared between threads.
+
+    Holds at most `max_size` entries, throwing out the least recently used
+    ones first.  With `ttl`, entries also expire that many seconds after
+    they were added.
+
+    `hits` and `misses` count how often get() found something over the
+    cache's lifetime.
+    """
+    def __init__(self, max_size=1000, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key => (time added, value), least recently used first
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the value cached for `key`, or None."""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and (
+                    self.ttl is None or time.time() - entry[0] < self.ttl):
+                # Move it to the most recently used end
+                self.entries[key] = entry
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Caches `value` for `key`."""
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = time.time(), value
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Forgets everything cached.  The counts are kept."""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Returns a dict of counts of hits and misses so far, and of the
+        entries cached right now.
+        """
+        with self.lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        size=len(self.entries))
+
+
 class PokedexLookup(object):
     MAX_FUZZY_RESULTS = 10
     MAX_EXACT_RESULTS = 43
     INTERMEDIATE_FACTOR = 2
+    MAX_IDS_PER_QUERY = 500
+    # Names per task for rebuild_index()'s worker processes
+    INDEX_CHUNK_SIZE = 2000
+    # Difference between the sort keys of neighbouring documents in a new
+    # index; see _assign_sort_keys()
+    SORT_KEY_GAP = 1 << 20
 
     # Dictionary of table name => table class.
     # Need the table name so we can get the class from the table name after we
@@ -120,7 +361,10 @@ class PokedexLookup(object):
     )
 
 
-    def __init__(self, directory=None, session=None):
+    backends = ('whoosh', 'native')
+
+    def __init__(self, directory=None, session=None, backend='whoosh',
+                 cache_size=0, cache_ttl=None):
         """Opens the whoosh index stored in the named directory.  If the index
         doesn't already exist, it will be created.
 
@@ -132,15 +376,38 @@ class PokedexLookup(object):
             Used for creating the index and retrieving objects.  Defaults to an
             attempt to connect to the default SQLite database installed by
             `pokedex setup`.
+
+        `backend`
+            What to search: 'whoosh' for the whoosh index, or 'native' for the
+            name index (see `pokedex.nameindex`) that rebuild_index() writes
+            alongside it.  Results are the same either way.  Both backends
+            use the name index for spelling corrections, which is much faster
+            than whoosh's corrector.
+
+        `cache_size`
+            If given, what lookup() finds for up to this many different
+            queries is kept in a ResultCache, `self.cache`, for `cache_ttl`
+            seconds (or until the index is rebuilt, by default).  Only the
+            rows found are cached; their objects are fetched again each time.
         """
 
         # By the time this returns, self.index and self.session must be set
 
+        if backend not in self.backends:
+            raise ValueError("Unknown lookup backend %r" % (backend,))
+
         # If a directory was not given, use the default
         if directory is None:
             directory = get_default_index_dir()
 
         self.directory = directory
+        self.backend = backend
+        self._languages = None
+        self._ids = {}
+        if cache_size:
+            self.cache = ResultCache(cache_size, cache_ttl)
+        else:
+            self.cache = None
 
         if session:
             self.session = session
@@ -153,6 +420,8 @@ class PokedexLookup(object):
             # rebuild_index before doing anything.  Provide a dummy object that
             # complains when used
             self.index = UninitializedIndex()
+            self.searchers = SearcherPool(self.index)
+            self._names = self._names_file_identity(), UninitializedIndex()
             return
 
         # Otherwise, already exists; should be an index!  Bam, done.
@@ -165,15 +434,114 @@ class PokedexLookup(object):
                 "The index directory already contains files.  "
                 "Please use a dedicated directory for the lookup index."
             )
+        self.searchers = SearcherPool(self.index)
+        self._names = None, None
+        self._reopen_names()
+
+    @property
+    def names(self):
+        """The name index, or None if the whoosh backend is making do without
+        one (see _open_names()).
+
+        Like the searchers, it's reopened if the file has been replaced since
+        it was opened, e.g. by `pokedex reindex` in another process.
+        """
+        identity, names = self._names
+        if self._names_file_identity() != identity:
+            names = self._reopen_names()
+        return names
+
+    def _names_file_identity(self):
+        """Returns something that changes whenever the name index file is
+        replaced, or None if there's no file.
+        """
+        try:
+            stat = os.stat(os.path.join(self.directory, nameindex.FILENAME))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime, stat.st_size
+
+    def _reopen_names(self):
+        """Opens the name index afresh, and returns it."""
+        # Look at the file before opening it: if it's replaced in between,
+        # the next lookup opens it again rather than never
+        identity = self._names_file_identity()
+        names = self._open_names()
+        self._names = identity, names
+        return names
+
+    def _open_names(self):
+        """Opens the name index.
+
+        The whoosh backend only uses it for spelling corrections and
+        completions, and makes do without it (returning None) if the index is
+        from before it existed or was written by an older version.
+        """
+        path = os.path.join(self.directory, nameindex.FILENAME)
+        if not os.path.exists(path):
+            if self.backend != 'native':
+                return None
+            raise IOError(
+                "The index directory has no name index.  "
+                "Please use `pokedex reindex` to create it."
+            )
+        try:
+            return nameindex.NameIndex(path)
+        except IOError:
+            if self.backend != 'native':
+                return None
+            raise
+
+    def close(self):
+        """Closes the searchers kept open between lookups.  The lookup can
+        still be used afterwards.
+        """
+        self.searchers.reset(self.index)
+
+    def rebuild_index(self, jobs=1, verbose=False, incremental=False):
+        """Creates the index from scratch.
+
+        All the names of a table are fetched with one query.  With `jobs`
+        greater than 1, names are normalized and romanized by that many
+        worker processes, and whoosh writes the index with as many.
 
-    def rebuild_index(self):
-        """Creates the index from scratch."""
+        With `incremental`, the existing index is updated instead: only the
+        documents for a (table, row_id, language) whose names changed are
+        replaced, in a single commit, so searchers go straight from the old
+        index to the new one.  If the index can't be updated (it doesn't
+        exist, or was made by an older version of this code), it's rebuilt
+        from scratch as usual.
+
+        With `verbose`, the time taken for each table and for writing the
+        indexes is printed.
+        """
+        print_start, print_status, print_done = _get_verbose_prints(verbose)
+        try:
+            self._rebuild_index(jobs, incremental, print_start, print_done)
+        finally:
+            # Only forget what was looked up once the new index is in place;
+            # lookups made while it's being built would see the old one
+            self._languages = None
+            self._ids = {}
+            if self.cache is not None:
+                self.cache.clear()
+
+    def _rebuild_index(self, jobs, incremental, print_start, print_done):
+        """Does the work of rebuild_index()."""
+        documents = self._get_documents(jobs, print_start, print_done)
+
+        if incremental and self._update_index(documents, print_start, print_done):
+            return
 
         schema = whoosh.fields.Schema(
             name=whoosh.fields.ID(sortable=True, stored=True, spelling=True),
             table=whoosh.fields.ID(sortable=True, stored=True),
             row_id=whoosh.fields.ID(sortable=True, stored=True),
-            language=whoosh.fields.STORED,
+            language=whoosh.fields.ID(sortable=True, stored=True),
+            # Rank by _table_order, name and then document order; see
+            # _search() and _assign_sort_keys().  It's only ever sorted on, so
+            # it's a bare column rather than an indexed field.
+            sort_key=whoosh.fields.COLUMN(whoosh.columns.NumericColumn('q')),
             iso639=whoosh.fields.ID(sortable=True, stored=True),
             iso3166=whoosh.fields.ID(sortable=True, stored=True),
             display_name=whoosh.fields.STORED,  # non-lowercased name
@@ -183,52 +551,220 @@ class PokedexLookup(object):
             # create_in() isn't totally reliable, so just nuke whatever's there
             # manually.  Try to be careful about this...
             for f in os.listdir(self.directory):
-                if re.match('^_?(MAIN|SPELL)_', f):
+                if re.match('^_?(MAIN|SPELL)_', f) or f == nameindex.FILENAME:
                     os.remove(os.path.join(self.directory, f))
         else:
             os.mkdir(self.directory)
 
         self.index = whoosh.index.create_in(self.directory, schema=schema,
                                                             indexname='MAIN')
-        writer = self.index.writer()
 
-        # Index every name in all our tables of interest
-        for cls in self.indexed_tables.values():
-            q = self.session.query(cls).order_by(cls.id)
+        self._assign_sort_keys(documents)
 
-            for row in q:
-                row_key = dict(table=text_type(cls.__tablename__),
-                               row_id=text_type(row.id))
+        print_start('Writing whoosh index')
+        start = time.time()
+        if jobs > 1:
+            writer = self.index.writer(procs=jobs)
+        else:
+            writer = self.index.writer()
+        for document in documents:
+            writer.add_document(**document)
+        writer.commit()
+        self.searchers.reset(self.index)
+        print_done('%.2fs' % (time.time() - start))
 
-                def add(name, language, iso639, iso3166):
-                    normalized_name = self.normalize_name(name)
+        self._write_names(documents, print_start, print_done)
 
-                    writer.add_document(
-                        name=normalized_name, display_name=name,
-                        language=language, iso639=iso639, iso3166=iso3166,
-                        **row_key
-                    )
+    def _get_documents(self, jobs, print_start, print_done):
+        """Returns the documents to index for every name in all our tables of
+        interest.  See rebuild_index().
+        """
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs)
+            map_chunks = pool.imap
+        else:
+            pool = None
+            map_chunks = map
+        documents = []
+        try:
+            for table_name, cls in self.indexed_tables.items():
+                print_start(table_name)
+                start = time.time()
+
+                rows = self._get_names(cls)
+                chunks = [(table_name, rows[n:n + self.INDEX_CHUNK_SIZE])
+                          for n in range(0, len(rows), self.INDEX_CHUNK_SIZE)]
+                count = len(documents)
+                for chunk_documents in map_chunks(_make_documents, chunks):
+                    documents.extend(chunk_documents)
+
+                print_done('%d names, %.2fs' % (
+                    len(documents) - count, time.time() - start))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        return documents
+
+    def _assign_sort_keys(self, documents):
+        """Gives every document a sort key.
+
+        Sorting on one fixed-width number is much cheaper for whoosh than
+        sorting on the table and then the name column.  Keys are
+        SORT_KEY_GAP apart, to leave room for _update_index() to fit new
+        names in between.
+        """
+        ranked = sorted(range(len(documents)), key=lambda n: (
+            _table_order[documents[n]['table']], documents[n]['name'], n))
+        for rank, n in enumerate(ranked):
+            documents[n]['sort_key'] = (rank + 1) * self.SORT_KEY_GAP
 
-                if cls == tables.PokemonForm:
-                    name_map = 'pokemon_name_map'
-                else:
-                    name_map = 'name_map'
+    def _slot_sort_keys(self, kept, added):
+        """Gives the `added` documents sort keys that fit them in among the
+        `kept` documents, which already have theirs.
 
-                for language, name in getattr(row, name_map, {}).items():
-                    if not name:
-                        continue
+        Returns False if there's no room left between two keys.
+        """
+        merged = sorted(
+            [((_table_order[document['table']], document['name'],
+               0, document['sort_key']), document) for document in kept] +
+            [((_table_order[document['table']], document['name'], 1, n),
+              document) for n, document in enumerate(added)],
+            key=lambda pair: pair[0])
+
+        previous = 0
+        pending = []
+        for position, document in merged + [(None, None)]:
+            if document is not None and 'sort_key' not in document:
+                pending.append(document)
+                continue
 
-                    add(name, language.identifier,
-                              language.iso639,
-                              language.iso3166)
+            if pending:
+                if document is None:
+                    following = previous + (len(pending) + 1) * self.SORT_KEY_GAP
+                else:
+                    following = document['sort_key']
+                step = (following - previous) // (len(pending) + 1)
+                if not step:
+                    return False
+                for n, pending_document in enumerate(pending, 1):
+                    pending_document['sort_key'] = previous + n * step
+                pending = []
+
+            if document is not None:
+                previous = document['sort_key']
+        return True
+
+    def _update_index(self, documents, print_start, print_done):
+        """Updates the existing index to hold `documents`, replacing only the
+        documents for a (table, row_id, language) whose names changed.
+
+        Returns False, having changed nothing, if the index can't be updated.
+        """
+        if isinstance(self.index, UninitializedIndex):
+            return False
+        schema = self.index.schema
+        if ('sort_key' not in schema or getattr(
+                schema['sort_key'].column_type, '_typecode', None) != 'q'):
+            # Made before sort keys left room for updates
+            return False
+
+        def key(document):
+            return document['table'], document['row_id'], document['language']
+
+        def content(documents):
+            return sorted((document['name'], document['display_name'],
+                           document['iso639'], document['iso3166'])
+                          for document in documents)
+
+        print_start('Updating whoosh index')
+        start = time.time()
+        writer = self.index.writer()
+        try:
+            reader = writer.reader()
+            sort_keys = reader.column_reader('sort_key')
+            old = {}
+            for docnum, document in reader.iter_docs():
+                document['sort_key'] = sort_keys[docnum]
+                old.setdefault(key(document), []).append((docnum, document))
+
+            new = {}
+            for document in documents:
+                new.setdefault(key(document), []).append(document)
+
+            changed = set(
+                document_key for document_key in set(old) | set(new)
+                if content(document for docnum, document
+                           in old.get(document_key, []))
+                != content(new.get(document_key, [])))
+            if not changed:
+                writer.cancel()
+                print_done('up to date, %.2fs' % (time.time() - start))
+                return True
+
+            kept = [document
+                    for document_key, docs in old.items()
+                    if document_key not in changed
+                    for docnum, document in docs]
+            added = [document for document in documents
+                     if key(document) in changed]
+            if not self._slot_sort_keys(kept, added):
+                writer.cancel()
+                print_done('no room; rebuilding')
+                return False
+
+            removed = 0
+            for document_key in changed:
+                for docnum, document in old.get(document_key, []):
+                    writer.delete_document(docnum)
+                    removed += 1
+            for document in added:
+                writer.add_document(**document)
+        except:
+            writer.cancel()
+            raise
+
+        # Searchers pick up the new generation as they're taken out of the
+        # pool; there's never a moment with an empty index
+        writer.commit()
+        print_done('%d names added, %d removed, %.2fs' % (
+            len(added), removed, time.time() - start))
 
-                    # Add generated Roomaji too
-                    # XXX this should be a first-class concept, not
-                    # piggybacking on Japanese
-                    if language.identifier == 'ja-Hrkt':
-                        add(romanize(name), language.identifier, language.iso639, language.iso3166)
+        self._write_names(kept + added, print_start, print_done)
+        return True
 
-        writer.commit()
+    def _write_names(self, documents, print_start, print_done):
+        """Writes the name index of `documents`, which have their sort keys.
+        The new file replaces the old one in one step.
+        """
+        print_start('Writing name index')
+        start = time.time()
+        nameindex.build_name_index(
+            os.path.join(self.directory, nameindex.FILENAME), documents)
+        # The replaced index isn't closed here: other threads may be in the
+        # middle of using it.  It's unmapped once the last of them lets go.
+        self._reopen_names()
+        print_done('%.2fs' % (time.time() - start))
+
+    def _get_names(self, cls):
+        """Returns all the names of rows of the indexed table `cls`, as a list
+        of `(row_id, name, language identifier, iso639, iso3166)`, ordered by
+        row and language.
+        """
+        if cls == tables.PokemonForm:
+            name_map = cls.pokemon_name_map
+        else:
+            name_map = cls.name_map
+        names_table = name_map.target_class
+        name_column = getattr(names_table, name_map.value_attr)
+
+        q = self.session.query(
+            names_table.foreign_id, name_column, tables.Language.identifier,
+            tables.Language.iso639, tables.Language.iso3166,
+        ).join(tables.Language,
+               names_table.local_language_id == tables.Language.id) \
+            .order_by(names_table.foreign_id, names_table.local_language_id)
+        return q.all()
 
 
     def normalize_name(self, name):
@@ -236,36 +772,22 @@ class PokedexLookup(object):
 
         Specifically: everything is lowercased, and accents are removed.
         """
-        # http://stackoverflow.com/questions/517923/what-is-the-best-way-to-remove-accents-in-a-python-unicode-string
-        # Makes sense to me.  Decompose by Unicode rules, then remove combining
-        # characters, then recombine.  I'm explicitly doing it this way instead
-        # of testing combining() because Korean characters apparently
-        # decompose!  But the results are considered letters, not combining
-        # characters, so testing for Mn works well, and combining them again
-        # makes them look right.
-        nkfd_form = unicodedata.normalize('NFKD', text_type(name))
-        name = u"".join(c for c in nkfd_form
-                        if unicodedata.category(c) != 'Mn')
-        name = unicodedata.normalize('NFC', name)
-
-        name = name.strip()
-        name = name.lower()
-
-        return name
+        return normalize_name(name)
 
 
     def _apply_valid_types(self, name, valid_types):
         """Combines the enforced `valid_types` with any from the search string
-        itself and updates the query.
+        itself.
 
         For example, a name of 'a,b:foo' and valid_types of b,c will search for
         only `b`s named "foo".
 
-        Returns `(name, merged_valid_types, term)`, where `name` has had any type
-        prefix stripped, `merged_valid_types` combines the original
-        `valid_types` with the type prefix, and `term` is a query term for
-        limited to just the allowed types.  If there are no type restrictions
-        at all, `term` will be None.
+        Returns `(name, merged_valid_types, table_names, lang_codes)`, where
+        `name` has had any type prefix stripped, `merged_valid_types` combines
+        the original `valid_types` with the type prefix, `table_names` are the
+        tables to search and `lang_codes` are the ISO 639 or 3166 codes of the
+        languages to search.  Either list is empty if it doesn't restrict
+        anything; see _restriction_term() to make a query term of them.
         """
 
         # Remove any type prefix (pokemon:133) first
@@ -312,21 +834,30 @@ class PokedexLookup(object):
         type_requirements = merge_requirements(lambda req: req[0] != u'@')
         all_requirements = lang_requirements + type_requirements
 
-        # Construct the term
-        lang_terms = []
-        for lang in lang_requirements:
-            # Allow for either country or language codes
-            lang_code = lang[1:]
-            lang_terms.append(whoosh.query.Term(u'iso639', lang_code))
-            lang_terms.append(whoosh.query.Term(u'iso3166', lang_code))
+        lang_codes = [lang[1:] for lang in lang_requirements]
 
-        type_terms = []
+        table_names = []
         for type in type_requirements:
             table_name = self._parse_table_name(type)
 
             # Quietly ignore bogus valid_types; more likely to DTRT
             if table_name:
-                type_terms.append(whoosh.query.Term(u'table', table_name))
+                table_names.append(table_name)
+
+        return name, all_requirements, table_names, lang_codes
+
+    def _restriction_term(self, table_names, lang_codes):
+        """Returns a whoosh query term for the restrictions from
+        _apply_valid_types().
+        """
+        lang_terms = []
+        for lang_code in lang_codes:
+            # Allow for either country or language codes
+            lang_terms.append(whoosh.query.Term(u'iso639', lang_code))
+            lang_terms.append(whoosh.query.Term(u'iso3166', lang_code))
+
+        type_terms = [whoosh.query.Term(u'table', table_name)
+                      for table_name in table_names]
 
         # Combine both kinds of restriction
         all_terms = []
@@ -335,7 +866,7 @@ class PokedexLookup(object):
         if lang_terms:
             all_terms.append(whoosh.query.Or(lang_terms))
 
-        return name, all_requirements, whoosh.query.And(all_terms)
+        return whoosh.query.And(all_terms)
 
 
     def _parse_table_name(self, name):
@@ -356,30 +887,74 @@ class PokedexLookup(object):
         # Bogus.  Be nice and return dummy
         return None
 
-    def _whoosh_records_to_results(self, records, exact=True):
+    def _get_languages(self):
+        """Returns a dict of language identifiers to Language rows.
+
+        The rows are cached for as long as they're still in the session, so
+        this normally costs no queries at all.
+        """
+        languages = self._languages
+        if languages is None or not all(
+                language in self.session for language in languages.values()):
+            languages = self._languages = dict(
+                (row.identifier, row)
+                for row in self.session.query(tables.Language)
+            )
+        return languages
+
+    def _get_objects(self, records):
+        """Fetches the database objects for the given whoosh records, with one
+        query per table.
+
+        Returns a dict of (table name, row id) to object.
+        """
+        ids_by_table = {}
+        for record in records:
+            ids_by_table.setdefault(record['table'], set()).add(
+                int(record['row_id']))
+
+        objects = {}
+        for table_name, ids in ids_by_table.items():
+            cls = self.indexed_tables[table_name]
+            ids = sorted(ids)
+            # Keep clear of the limit on the number of SQL parameters
+            for start in range(0, len(ids), self.MAX_IDS_PER_QUERY):
+                chunk = ids[start:start + self.MAX_IDS_PER_QUERY]
+                for obj in self.session.query(cls).filter(cls.id.in_(chunk)):
+                    objects[table_name, obj.id] = obj
+        return objects
+
+    def _unique_records(self, records):
+        """Returns the records with the first one for each row only."""
+        seen = set()
+        unique_records = []
+        for record in records:
+            seen_key = record['table'], record['row_id']
+            if seen_key not in seen:
+                seen.add(seen_key)
+                unique_records.append(record)
+        return unique_records
+
+    def _whoosh_records_to_results(self, records, exact=True, objects=None):
         """Converts a list of whoosh's indexed records to LookupResult tuples
         containing database objects.
+
+        `objects` may be a dict from _get_objects() that already has the
+        objects for the records.
         """
-        # XXX cache me?
-        languages = dict(
-            (row.identifier, row)
-            for row in self.session.query(tables.Language)
-        )
+        languages = self._get_languages()
+
+        # Skip dupes
+        unique_records = self._unique_records(records)
+
+        if objects is None:
+            objects = self._get_objects(unique_records)
+
         # XXX this 'exact' thing is getting kinda leaky.  would like a better
         # way to handle it, since only lookup() cares about fuzzy results
-        seen = {}
         results = []
-        for record in records:
-            # Skip dupes
-            seen_key = record['table'], record['row_id']
-            if seen_key in seen:
-                continue
-            seen[seen_key] = True
-
-            # XXX minimize queries here?
-            cls = self.indexed_tables[record['table']]
-            obj = self.session.query(cls).get(record['row_id'])
-
+        for record in unique_records:
+            obj = objects.get((record['table'], int(record['row_id'])))
             results.append(LookupResult(object=obj,
                                         indexed_name=record['name'],
                                         name=record['display_name'],
@@ -390,6 +965,122 @@ class PokedexLookup(object):
 
         return results
 
+    def _search(self, searcher, query, locale, limit=10, extra_weights={}):
+        u"""Runs `query` and returns the stored fields of its hits: Pokémon
+        first, then moves, etc., and by name within each table, but with
+        names in `locale` and the other languages LanguageFacet likes first.
+
+        Every hit is ranked by language (see _language_groups()) and then by
+        the precomputed sort_key column of the index, so the `limit` hits
+        that are kept are the ones LanguageFacet would have put first.  Like
+        whoosh's own search(), `limit` defaults to 10.
+        `extra_weights` are applied on top of that, to every hit, before any
+        are dropped.
+        """
+        if 'sort_key' not in searcher.schema:
+            # An index from before sort_key existed; sort the slow way
+            facet = whoosh.sorting.MultiFacet([
+                LanguageFacet(locale.identifier, extra_weights),
+                table_facet,
+                "name",
+            ])
+            return [hit.fields() for hit in
+                    searcher.search(query, limit=limit, sortedby=facet)]
+
+        groups = _language_groups(searcher.field_terms('language'),
+                                  locale.identifier)
+        priorities = dict((identifier, n) for n, group in enumerate(groups)
+                          for identifier in group)
+        # The language column is slow to open, but the stored fields are
+        # needed anyway
+        sort_keys = searcher.reader().column_reader('sort_key')
+        hits = sorted(
+            ((searcher.stored_fields(docnum), sort_keys[docnum])
+             for docnum in searcher.docs_for_query(query)),
+            key=lambda hit: (priorities[hit[0]['language']], hit[1]))
+        records = [fields for fields, sort_key in hits]
+
+        if extra_weights:
+            records = boost_languages(records, locale.identifier,
+                                      extra_weights)
+        return records[:limit]
+
+    @contextlib.contextmanager
+    def _using_searcher(self, searcher=None):
+        """Context manager that provides `searcher`, or if that's None, one
+        from the pool.
+        """
+        if searcher is not None:
+            yield searcher
+        else:
+            with self.searchers.searcher() as searcher:
+                yield searcher
+
+    def _find(self, kind, value, table_names, lang_codes, locale, limit=10,
+              extra_weights={}, searcher=None):
+        """Searches whichever backend is in use, and returns a list of
+        records ranked as by _search().
+
+        `kind` is what to look for:
+        - 'names': any of the (normalized) names in the list `value`
+        - 'wildcard': names matching the pattern `value`
+        - 'prefix': names starting with `value`
+        - 'id': rows with the id `value`, in any table
+        `table_names` and `lang_codes` come from _apply_valid_types().
+
+        The whoosh backend uses `searcher` if it's given.
+        """
+        if self.backend == 'native':
+            names = self.names
+            if kind == 'names':
+                entries = names.find_names(value)
+            elif kind == 'wildcard':
+                entries = names.find_wildcard(value)
+            elif kind == 'prefix':
+                entries = names.find_prefix(value)
+            else:
+                entries = names.find_ids(value)
+            if limit is None or extra_weights:
+                records = names.records(entries, table_names, lang_codes)
+                return boost_languages(records, locale.identifier,
+                                       extra_weights)[:limit]
+            languages = _language_groups(
+                [identifier for identifier, iso639, iso3166 in names.languages],
+                locale.identifier)
+            return names.records(entries, table_names, lang_codes, limit,
+                                 languages=languages)
+
+        if kind == 'names':
+            query = whoosh.query.Or([whoosh.query.Term(u'name', name)
+                                     for name in value])
+        elif kind == 'wildcard':
+            query = whoosh.query.Wildcard(u'name', value)
+        elif kind == 'prefix':
+            query = whoosh.query.Prefix(u'name', value)
+        else:
+            query = whoosh.query.Term(u'row_id', text_type(value))
+
+        type_term = self._restriction_term(table_names, lang_codes)
+        if type_term:
+            query = query & type_term
+
+        with self._using_searcher(searcher) as searcher:
+            return self._search(searcher, query, locale, limit=limit,
+                                extra_weights=extra_weights)
+
+    def _suggest(self, name, limit, searcher=None):
+        """Returns up to `limit` spelling corrections for `name`, best first.
+
+        The deletion dictionary of the name index finds the same suggestions
+        as whoosh's corrector, which has to walk the whole word graph.
+        """
+        names = self.names
+        if names:
+            return names.suggest(name, limit=limit)
+
+        with self._using_searcher(searcher) as searcher:
+            return searcher.corrector('name').suggest(name, limit=limit)
+
     def _get_current_locale(self):
         """Returns the session's current default language, as an ORM row."""
         return self.session.query(tables.Language).get(
@@ -436,21 +1127,84 @@ class PokedexLookup(object):
             default), and the provided `name` doesn't match anything exactly,
             spelling correction will be attempted.
         """
+        return self.lookup_many([input], valid_types, exact_only)[0]
 
-        name = self.normalize_name(input)
-        exact = True
+    def lookup_many(self, inputs, valid_types=[], exact_only=False):
+        """Looks up a lot of names at once.
 
-        # Pop off any type prefix and merge with valid_types
-        name, merged_valid_types, type_term = \
-            self._apply_valid_types(name, valid_types)
+        Returns a list with a list of results for each of the `inputs`, in the
+        same order.  Each input is treated just as lookup() would treat it,
+        with the same `valid_types` and `exact_only`.
+
+        This is much faster than calling lookup() in a loop: inputs that are
+        the same once normalized are only searched for once, the searches share
+        a searcher, and the objects for all the results are fetched together,
+        with one query per table.  Searches found in the result cache, if
+        there is one, aren't done at all.
+        """
+        locale = self._get_current_locale()
+
+        # Parse every input, and search for each distinct query once
+        keys = []
+        found = {}
+        searcher = self.searchers.acquire() if self.backend == 'whoosh' else None
+        try:
+            for input in inputs:
+                # Pop off any type prefix and merge with valid_types
+                name, merged_valid_types, table_names, lang_codes = \
+                    self._apply_valid_types(self.normalize_name(input),
+                                            valid_types)
+
+                # Random lookup; every one is different
+                if name == 'random':
+                    keys.append(merged_valid_types)
+                    continue
+
+                key = name, tuple(table_names), tuple(lang_codes)
+                keys.append(key)
+                if key in found:
+                    continue
+
+                # The locale affects the order of results
+                cache_key = key + (exact_only, locale.id)
+                if self.cache is not None:
+                    found[key] = self.cache.get(cache_key)
+                    if found[key] is not None:
+                        continue
 
-        # Random lookup
-        if name == 'random':
-            return self.random_lookup(valid_types=merged_valid_types)
+                found[key] = self._lookup_records(
+                    name, table_names, lang_codes, exact_only, locale,
+                    searcher)
+                if self.cache is not None:
+                    self.cache.put(cache_key, found[key])
+        finally:
+            if searcher is not None:
+                self.searchers.release(searcher)
+
+        ### Convert results to db objects
+        objects = self._get_objects(
+            record for records, exact in found.values() for record in records)
+        results = dict(
+            (key, self._whoosh_records_to_results(records, exact, objects))
+            for key, (records, exact) in found.items())
+
+        return [list(results[key]) if isinstance(key, tuple)
+                else self.random_lookup(valid_types=key)
+                for key in keys]
+
+    def _lookup_records(self, name, table_names, lang_codes, exact_only,
+                        locale, searcher=None):
+        """Does the searching for lookup().
+
+        Returns `(records, exact)`, where `records` are the records for as
+        many rows as lookup() returns, and `exact` is False if they're
+        spelling corrections.
+        """
+        exact = True
 
         # Do different things depending what the query looks like
-        # Note: Term objects do an exact match, so we don't have to worry about
-        # a query parser tripping on weird characters in the input
+        # Note: names are matched exactly, so we don't have to worry about a
+        # query parser tripping on weird characters in the input
         try:
             # Let Python try to convert to a number, so 0xff works
             name_as_number = int(name, base=0)
@@ -460,18 +1214,14 @@ class PokedexLookup(object):
 
         if '*' in name or '?' in name:
             exact_only = True
-            query = whoosh.query.Wildcard(u'name', name)
+            kind, value = 'wildcard', name
         elif name_as_number is not None:
             # Don't spell-check numbers!
             exact_only = True
-            query = whoosh.query.Term(u'row_id', text_type(name_as_number))
+            kind, value = 'id', name_as_number
         else:
             # Not an integer
-            query = whoosh.query.Term(u'name', name)
-
-        if type_term:
-            query = query & type_term
-
+            kind, value = 'names', [name]
 
         ### Actual searching
         # Limits; result limits are constants, and intermediate results (before
@@ -485,54 +1235,61 @@ class PokedexLookup(object):
         else:
             max_results = self.MAX_FUZZY_RESULTS
 
-        locale = self._get_current_locale()
-        facet = whoosh.sorting.MultiFacet([
-            LanguageFacet(locale.identifier),
-            table_facet,
-            "name",
-        ])
-        searcher = self.index.searcher()
-        results = searcher.search(
-            query,
+        records = self._find(
+            kind, value, table_names, lang_codes, locale,
             limit=int(max_results * self.INTERMEDIATE_FACTOR),
-            sortedby=facet,
+            searcher=searcher,
         )
 
         # Look for some fuzzy matches if necessary
-        if not exact_only and not results:
+        if not exact_only and not records:
             exact = False
-            results = []
 
-            fuzzy_query_parts = []
+            suggestions = self._suggest(name, limit=max_results,
+                                        searcher=searcher)
+            if not suggestions:
+                # Nothing at all; don't try querying
+                return [], exact
+
             fuzzy_weights = {}
-            corrector = searcher.corrector('name')
-            for suggestion in corrector.suggest(name, limit=max_results):
-                fuzzy_query_parts.append(whoosh.query.Term('name', suggestion))
+            for suggestion in suggestions:
                 distance = levenshtein.relative(name, suggestion)
                 fuzzy_weights[suggestion] = distance
 
-            if not fuzzy_query_parts:
-                # Nothing at all; don't try querying
-                return []
-
-            fuzzy_query = whoosh.query.Or(fuzzy_query_parts)
-            if type_term:
-                fuzzy_query = fuzzy_query & type_term
-
-            sorter = LanguageFacet(
-                locale.identifier, extra_weights=fuzzy_weights)
-            results = searcher.search(fuzzy_query, sortedby=sorter)
-
-        ### Convert results to db objects
-        objects = self._whoosh_records_to_results(results, exact=exact)
+            # The weights have to see every hit, not just the first few by
+            # sort key, or the closest names in the locale can get cut off.
+            # There are few enough suggestions that this stays cheap.
+            records = self._find('names', suggestions, table_names, lang_codes,
+                                 locale, limit=None,
+                                 extra_weights=fuzzy_weights,
+                                 searcher=searcher)
 
         # Truncate and return
-        return objects[:max_results]
+        return self._unique_records(records)[:max_results], exact
 
 
-    def random_lookup(self, valid_types=[]):
+    def _get_ids(self, table_name):
+        """Returns an array of the ids of all the rows in a table, for
+        random_lookup().  It's fetched once and kept until the index is
+        rebuilt.
+        """
+        ids = self._ids.get(table_name)
+        if ids is None:
+            cls = self.indexed_tables[table_name]
+            ids = self._ids[table_name] = array.array('i', (
+                id for id, in self.session.query(cls.id).order_by(cls.id)))
+        return ids
+
+    def random_lookup(self, valid_types=[], n=1, weighted=False):
         """Returns a random lookup result from one of the provided
         `valid_types`.
+
+        With `n`, returns the results of that many random picks, which are
+        independent of each other, so the same thing may come up twice.
+
+        By default, each pick chooses a table first, then a row from it, so
+        things from small tables like Type come up as often as Pokémon do.
+        With `weighted`, every row of every table is equally likely instead.
         """
 
         table_names = []
@@ -551,37 +1308,124 @@ class PokedexLookup(object):
             table_names = list(self.indexed_tables)
             table_names.remove('pokemon_forms')
 
-        # Pick a random table, then pick a random item from it.  Small tables
-        # like Type will have an unnatural bias.  The alternative is that a
-        # simple search for "random" will do some eight queries, counting the
-        # rows in every single indexed table, and that's awful.
-        # XXX Can we improve on this, reasonably?
-        table_name = random.choice(table_names)
-        count = self.session.query(self.indexed_tables[table_name]).count()
-        id, = self.session.query(self.indexed_tables[table_name].id) \
-            .offset(random.randint(0, count - 1)) \
-            .first()
+        # The ids of every table are kept in memory, so picking a row is just
+        # picking an index into an array
+        table_names = [table_name for table_name in table_names
+                       if self._get_ids(table_name)]
+        if not table_names:
+            return []
+        ends = []
+        total = 0
+        for table_name in table_names:
+            total += len(self._get_ids(table_name))
+            ends.append(total)
+
+        picks = []
+        for i in range(n):
+            if weighted:
+                position = random.randrange(total)
+                table_number = bisect.bisect_right(ends, position)
+                ids = self._get_ids(table_names[table_number])
+                id = ids[position - ends[table_number] + len(ids)]
+            else:
+                table_number = random.randrange(len(table_names))
+                id = random.choice(self._get_ids(table_names[table_number]))
+            picks.append((table_names[table_number], text_type(id)))
+
+        # Look up the picks from each table together
+        results = {}
+        for table_name in set(table_name for table_name, id in picks):
+            ids = [id for pick_table_name, id in picks
+                   if pick_table_name == table_name]
+            results.update(
+                ((table_name, id), id_results) for id, id_results
+                in zip(ids, self.lookup_many(ids, valid_types=[table_name])))
 
-        return self.lookup(text_type(id), valid_types=[table_name])
+        return [result for pick in picks for result in results[pick]]
 
     def prefix_lookup(self, prefix, valid_types=[]):
         """Returns terms starting with the given exact prefix.
 
         Type prefixes are recognized, but no other name munging is done.
+
+        This finds every match and fetches all their objects; to complete
+        names as someone types them, use complete() instead.
         """
 
         # Pop off any type prefix and merge with valid_types
-        prefix, merged_valid_types, type_term = \
+        prefix, merged_valid_types, table_names, lang_codes = \
             self._apply_valid_types(prefix, valid_types)
 
-        query = whoosh.query.Prefix(u'name', self.normalize_name(prefix))
-
-        if type_term:
-            query = query & type_term
-
         locale = self._get_current_locale()
-        searcher = self.index.searcher()
-        facet = LanguageFacet(locale.identifier)
-        results = searcher.search(query, sortedby=facet)  # XXX , limit=self.MAX_LOOKUP_RESULTS)
+        results = self._find('prefix', self.normalize_name(prefix),
+                             table_names, lang_codes, locale)
 
         return self._whoosh_records_to_results(results)
+
+    def complete(self, prefix, valid_types=[], limit=10, cursor=None):
+        """Returns up to `limit` names starting with `prefix`, for completing
+        what someone is typing.
+
+        Names in the current locale come first, then the other languages in
+        the order lookup() prefers them, and within a language, they're in
+        the order results are shown in: by table, then by name.  Each row
+        only appears once, under the first of its names that matches.  Type
+        prefixes and `valid_types` restrict the tables and languages, as in
+        lookup().
+
+        Returns `(completions, cursor)`, where `completions` is a list of
+        Completion tuples and `cursor` is a string to pass back in to get the
+        next `limit` completions, or None if there are no more.  No objects
+        are fetched; the completions have the table name and row id instead.
+
+        This needs the name index, which the whoosh backend can do without;
+        it raises IOError if there isn't a usable one.
+        """
+        prefix, merged_valid_types, table_names, lang_codes = \
+            self._apply_valid_types(prefix, valid_types)
+        names = self.names
+        if not names:
+            raise IOError(
+                "The index directory has no usable name index.  "
+                "Please use `pokedex reindex` to create it."
+            )
+
+        after = None
+        if cursor is not None:
+            try:
+                after = tuple(int(part) for part in cursor.split('.'))
+            except (AttributeError, ValueError):
+                after = ()
+            if len(after) != 2:
+                raise ValueError("Bad completion cursor %r" % (cursor,))
+
+        # Group the languages by how much lookup() prefers them.  The locale
+        # comes from the cached Language rows, to save a query per keystroke
+        locale_ident = None
+        for language in self._get_languages().values():
+            if language.id == self.session.default_language_id:
+                locale_ident = language.identifier
+        languages = _language_groups(
+            [identifier for identifier, iso639, iso3166 in names.languages
+             if not lang_codes or iso639 in lang_codes or iso3166 in lang_codes],
+            locale_ident)
+
+        entries, position = names.complete(
+            self.normalize_name(prefix), languages, table_names,
+            limit=limit, after=after)
+
+        completions = []
+        for n in entries:
+            record = names.record(n)
+            completions.append(Completion(
+                name=record['display_name'],
+                indexed_name=record['name'],
+                table=record['table'],
+                id=int(record['row_id']),
+                language=record['language'],
+                iso639=record['iso639'],
+                iso3166=record['iso3166'],
+            ))
+        if position is None:
+            return completions, None
+        return completions, '%d.%d' % position
@@ -2,9 +2,13 @@
 from __future__ import print_function
 
 import argparse
+import itertools
+import json
 import os
 import sys
 
+import six
+
 import pokedex.cli.search
 import pokedex.db
 import pokedex.db.load
@@ -12,6 +16,9 @@ import pokedex.db.tables
 import pokedex.lookup
 from pokedex import defaults
 
+# How many lines `pokedex lookup --stdin` looks up at a time
+LOOKUP_BATCH_SIZE = 1000
+
 
 def main(junk, *argv):
     parser = create_parser()
@@ -47,6 +54,12 @@ def create_parser():
             u'POKEDEX_INDEX_DIR environment variable) to specify an '
             u'alternate loction.',
     )
+    common_parser.add_argument(
+        '--lookup-backend', dest='lookup_backend', default='whoosh',
+        choices=pokedex.lookup.PokedexLookup.backends,
+        help=u'What lookups search: the whoosh index (the default) or the '
+            u'native name index built alongside it.',
+    )
     common_parser.add_argument(
         '-q', '--quiet', dest='verbose', action='store_false',
         help=u'Don\'t print system output.  This is the default for '
@@ -73,7 +86,13 @@ def create_parser():
         'lookup', help=u'Look up something in the Pokédex',
         parents=[common_parser])
     cmd_lookup.set_defaults(func=command_lookup)
-    cmd_lookup.add_argument('criteria', nargs='+')
+    cmd_lookup.add_argument('criteria', nargs='*')
+    cmd_lookup.add_argument(
+        '--stdin', dest='stdin', default=False, action='store_true',
+        help=u'look up every line of standard input, rather than the criteria')
+    cmd_lookup.add_argument(
+        '--jsonl', dest='jsonl', default=False, action='store_true',
+        help=u'print each lookup\'s results as a line of JSON')
 
     cmd_search = cmds.add_parser(
         'search', help=u'Find things by various criteria',
@@ -97,6 +116,22 @@ def create_parser():
     cmd_load.add_argument(
         '-S', '--safe', dest='safe', default=False, action='store_true',
         help="disable database-specific optimizations, such as Postgres's COPY FROM")
+    cmd_load.add_argument(
+        '--incremental', dest='incremental', default=False, action='store_true',
+        help="only reload tables whose CSV files changed since the last load, "
+            "then update the lookup index to match")
+    cmd_load.add_argument(
+        '-j', '--jobs', dest='jobs', default=1, type=int,
+        help="number of tables to load in parallel (ignored for SQLite)")
+    cmd_load.add_argument(
+        '--batch-size', dest='batch_size', default=1000, type=int,
+        help="number of rows to insert at a time (default: 1000)")
+    cmd_load.add_argument(
+        '--profile', dest='profile', default=None, metavar='REPORT',
+        help="write a JSON report of how long each step of the load took")
+    cmd_load.add_argument(
+        '--cache-dir', dest='cache_dir', default=None, metavar='DIR',
+        help="keep a compiled cache of the CSV files in DIR, to skip parsing them on later loads")
     # TODO need a custom handler for splittin' all of these
     cmd_load.add_argument(
         '-l', '--langs', dest='langs', default=None,
@@ -112,6 +147,9 @@ def create_parser():
     cmd_dump.add_argument(
         '-d', '--directory', dest='directory', default=None,
         help="directory to place the dumped CSV files")
+    cmd_dump.add_argument(
+        '-j', '--jobs', dest='jobs', default=1, type=int,
+        help="number of tables to dump in parallel (ignored for SQLite)")
     cmd_dump.add_argument(
         '-l', '--langs', dest='langs', default=None,
         help="comma-separated list of language codes to load, 'none', or 'all' (default: en)")
@@ -119,10 +157,37 @@ def create_parser():
         'tables', nargs='*',
         help="list of database tables to load (default: all)")
 
+    cmd_build_sqlite = cmds.add_parser(
+        'build-sqlite', help=u'Build a read-only SQLite database optimized for lookups',
+        parents=[common_parser])
+    cmd_build_sqlite.set_defaults(func=command_build_sqlite, verbose=True)
+    cmd_build_sqlite.add_argument(
+        '-d', '--directory', dest='directory', default=None,
+        help="directory containing the CSV files to load")
+    cmd_build_sqlite.add_argument(
+        '--cache-dir', dest='cache_dir', default=None, metavar='DIR',
+        help="keep a compiled cache of the CSV files in DIR, to skip parsing them on later loads")
+    cmd_build_sqlite.add_argument(
+        '--page-size', dest='page_size', default=8192, type=int,
+        help="SQLite page size of the database (default: 8192)")
+    cmd_build_sqlite.add_argument(
+        '-l', '--langs', dest='langs', default=None,
+        help="comma-separated list of language codes to load, or 'none' (default: all)")
+    cmd_build_sqlite.add_argument(
+        'output',
+        help="file to write the database to; open it with connect(..., read_only=True)")
+
     cmd_reindex = cmds.add_parser(
         'reindex', help=u'Rebuild the lookup index from the database',
         parents=[common_parser])
     cmd_reindex.set_defaults(func=command_reindex, verbose=True)
+    cmd_reindex.add_argument(
+        '-j', '--jobs', dest='jobs', default=1, type=int,
+        help="number of processes to prepare and write the index with")
+    cmd_reindex.add_argument(
+        '--incremental', dest='incremental', default=False, action='store_true',
+        help="only replace the names that changed, rather than rebuilding "
+            "the index from scratch")
 
     cmd_setup = cmds.add_parser(
         'setup', help=u'Combine load and reindex',
@@ -137,9 +202,11 @@ def create_parser():
     return parser
 
 
-def get_session(args):
+def get_session(args, local_infile=False):
     """Given a parsed options object, connects to the database and returns a
     session.
+
+    `local_infile` is passed on to pokedex.db.connect(); loading needs it.
     """
 
     engine_uri = args.engine_uri
@@ -148,7 +215,7 @@ def get_session(args):
     if engine_uri is None:
         engine_uri, got_from = defaults.get_default_db_uri_with_origin()
 
-    session = pokedex.db.connect(engine_uri)
+    session = pokedex.db.connect(engine_uri, local_infile=local_infile)
 
     if args.verbose:
         print("Connected to database %(engine)s (from %(got_from)s)"
@@ -175,10 +242,13 @@ def get_lookup(args, session=None, recreate=False):
         print("Opened lookup index %(index_dir)s (from %(got_from)s)"
             % dict(index_dir=index_dir, got_from=got_from))
 
-    lookup = pokedex.lookup.PokedexLookup(index_dir, session=session)
+    lookup = pokedex.lookup.PokedexLookup(index_dir, session=session,
+                                          backend=args.lookup_backend)
 
     if recreate:
-        lookup.rebuild_index()
+        lookup.rebuild_index(jobs=getattr(args, 'jobs', 1),
+                             verbose=args.verbose,
+                             incremental=getattr(args, 'incremental', False))
 
     return lookup
 
@@ -218,11 +288,12 @@ def command_dump(parser, args):
         tables=args.tables,
         verbose=args.verbose,
         langs=langs,
+        jobs=args.jobs,
     )
 
 
 def command_load(parser, args):
-    if not args.engine_uri:
+    if not args.engine_uri and not args.incremental:
         print("WARNING: You're reloading the default database, but not the lookup index.  They")
         print("         might get out of sync, and pokedex commands may not work correctly!")
         print("To fix this, run `pokedex reindex` when this command finishes.  Or, just use")
@@ -236,7 +307,7 @@ def command_load(parser, args):
     else:
         langs = [l.strip() for l in args.langs.split(',')]
 
-    session = get_session(args)
+    session = get_session(args, local_infile=True)
     get_csv_directory(args)
 
     pokedex.db.load.load(
@@ -248,19 +319,51 @@ def command_load(parser, args):
         safe=args.safe,
         recursive=args.recursive,
         langs=langs,
+        jobs=args.jobs,
+        incremental=args.incremental,
+        batch_size=args.batch_size,
+        profile=args.profile,
+        cache_dir=args.cache_dir,
+    )
+
+    if args.incremental:
+        # Only the names that changed are reindexed, so this is cheap
+        get_lookup(args, session=session, recreate=True)
+
+
+def command_build_sqlite(parser, args):
+    if args.langs == 'none':
+        langs = []
+    elif args.langs is None:
+        langs = None
+    else:
+        langs = [l.strip() for l in args.langs.split(',')]
+
+    get_csv_directory(args)
+
+    pokedex.db.load.build_sqlite(
+        args.output,
+        directory=args.directory,
+        verbose=args.verbose,
+        langs=langs,
+        cache_dir=args.cache_dir,
+        page_size=args.page_size,
     )
 
 
 def command_reindex(parser, args):
     session = get_session(args)
     get_lookup(args, session=session, recreate=True)
-    print("Recreated lookup index.")
+    if args.incremental:
+        print("Updated lookup index.")
+    else:
+        print("Recreated lookup index.")
 
 
 def command_setup(parser, args):
     args.directory = None
 
-    session = get_session(args)
+    session = get_session(args, local_infile=True)
     get_csv_directory(args)
     pokedex.db.load.load(
         session, directory=None, drop_tables=True,
@@ -311,12 +414,56 @@ def command_status(parser, args):
 ### User-facing commands
 
 def command_lookup(parser, args):
-    name = u' '.join(args.criteria)
+    if args.stdin:
+        if args.criteria:
+            parser.error("lookup takes either criteria or --stdin, not both")
+        names = (line.strip() for line in sys.stdin)
+        if six.PY2:
+            names = (name.decode('utf-8') for name in names)
+        names = (name for name in names if name)
+    elif args.criteria:
+        names = [u' '.join(args.criteria)]
+    else:
+        parser.error("lookup needs something to look up, or --stdin")
 
     session = get_session(args)
     lookup = get_lookup(args, session=session, recreate=False)
 
-    results = lookup.lookup(name)
+    # Look names up a batch at a time, so piped input streams through
+    names = iter(names)
+    while True:
+        batch = list(itertools.islice(names, LOOKUP_BATCH_SIZE))
+        if not batch:
+            break
+
+        for name, results in zip(batch, lookup.lookup_many(batch)):
+            if args.jsonl:
+                print(json.dumps(dict(
+                    input=name,
+                    results=[lookup_result_to_json(result) for result in results],
+                )))
+            else:
+                if args.stdin:
+                    print(u"%s:" % name)
+                print_lookup_results(results)
+        sys.stdout.flush()
+
+
+def lookup_result_to_json(result):
+    """Returns a JSON-friendly dict describing a LookupResult."""
+    return dict(
+        table=result.object.__tablename__,
+        id=result.object.id,
+        name=result.name,
+        indexed_name=result.indexed_name,
+        language=result.language.identifier,
+        iso639=result.language.iso639,
+        iso3166=result.language.iso3166,
+        exact=result.exact,
+    )
+
+
+def print_lookup_results(results):
     if not results:
         print("No matches.")
     elif results[0].exact:
@@ -0,0 +1,583 @@
+# encoding: utf8
+u"""Compact, memory-mappable index of the names that lookups search.
+
+This is an alternative to the whoosh index for `PokedexLookup`, built from
+the same documents by `rebuild_index()`, with far less overhead per query.
+Everything lives in one file of flat integer arrays and UTF-8 heaps, which
+is mapped into memory rather than read:
+
+- The distinct names, sorted, for exact, prefix and wildcard matching by
+  binary search.  (Sorting UTF-8 bytes sorts by code point, so the search
+  works on the raw bytes without decoding them.)
+- For every name, the entries (documents) that have it.
+- For every entry, its display name, table, language, row id, and its rank
+  in the order results are shown in.
+- The entries sorted by row id, for looking up IDs.
+- The entries sorted by language, then table, then rank, for completing
+  names.  Within each run of one language and table, names are in order, so
+  the names starting with a prefix are a slice of every run.
+- A deletion dictionary for fuzzy matching, in the style of SymSpell: every
+  string that can be made by deleting up to `max_distance` characters from
+  the first `prefix_length` characters of a name points back to that name.
+  A misspelling finds its candidates by looking up its own deletions, which
+  takes time independent of the number of names.
+
+The layout of the file is:
+
+    MAGIC
+    header length, as a little-endian 32-bit integer
+    header, as JSON
+    sections, each aligned to 8 bytes
+
+The header lists the tables and languages that entries refer to by number,
+and the offset, length and array typecode of every section.
+"""
+
+import array
+import bisect
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+
+import six
+from whoosh.support.levenshtein import damerau_levenshtein
+
+MAGIC = b'PDXNAMES'
+VERSION = 2
+
+#: Name of the index file within the lookup index directory
+FILENAME = 'NAMES.idx'
+
+_align = 8
+
+
+def _hash(text):
+    """Returns the key a deletion is stored under."""
+    return zlib.crc32(text.encode('utf-8')) & 0xffffffff
+
+
+def _deletions(text, max_distance):
+    """Returns the set of strings made by deleting up to `max_distance`
+    characters from `text`, including `text` itself.
+    """
+    deletions = set([text])
+    edge = set([text])
+    for distance in range(max_distance):
+        edge = set(word[:n] + word[n + 1:]
+                   for word in edge for n in range(len(word)))
+        edge -= deletions
+        deletions.update(edge)
+    return deletions
+
+
+def _encode_text(strings):
+    """Returns (offsets, heap) for a list of strings."""
+    offsets = array.array('i', [0])
+    heap = []
+    position = 0
+    for string in strings:
+        encoded = string.encode('utf-8')
+        heap.append(encoded)
+        position += len(encoded)
+        offsets.append(position)
+    return offsets, b''.join(heap)
+
+
+def build_name_index(path, documents, max_distance=2, prefix_length=7):
+    """Writes a name index of `documents` to `path`.
+
+    `documents` are dicts with the fields of the whoosh index: `name`
+    (normalized), `display_name`, `table`, `row_id`, `language`, `iso639`,
+    `iso3166` and `sort_key`.  Results are ranked by `sort_key`, and then
+    by the order of the documents.  Completion assumes that ranking puts the
+    names of each table in order, as rebuild_index()'s sort keys do.
+
+    The file is written under a temporary name and then moved into place, so
+    readers never see a half-written index.
+    """
+    documents = list(documents)
+
+    names = sorted(set(document['name'] for document in documents),
+                   key=lambda name: name.encode('utf-8'))
+    name_numbers = dict((name, n) for n, name in enumerate(names))
+
+    tables = sorted(set(document['table'] for document in documents))
+    table_numbers = dict((table, n) for n, table in enumerate(tables))
+    languages = sorted(set(
+        (document['language'], document['iso639'], document['iso3166'])
+        for document in documents))
+    language_numbers = dict((language, n) for n, language in enumerate(languages))
+
+    entries_by_name = [[] for name in names]
+    entry_names = array.array('i')
+    entry_tables = array.array('i')
+    entry_languages = array.array('i')
+    entry_row_ids = array.array('i')
+    for n, document in enumerate(documents):
+        name_number = name_numbers[document['name']]
+        entries_by_name[name_number].append(n)
+        entry_names.append(name_number)
+        entry_tables.append(table_numbers[document['table']])
+        entry_languages.append(language_numbers[
+            document['language'], document['iso639'], document['iso3166']])
+        entry_row_ids.append(int(document['row_id']))
+
+    entry_ranks = array.array('i', [0] * len(documents))
+    ranked = sorted(range(len(documents)),
+                    key=lambda n: (documents[n]['sort_key'], n))
+    for rank, n in enumerate(ranked):
+        entry_ranks[n] = rank
+
+    name_entry_starts = array.array('i', [0])
+    name_entries = array.array('i')
+    for entries in entries_by_name:
+        name_entries.extend(entries)
+        name_entry_starts.append(len(name_entries))
+
+    by_row_id = sorted(range(len(documents)),
+                       key=lambda n: (entry_row_ids[n], n))
+    id_row_ids = array.array('i', [entry_row_ids[n] for n in by_row_id])
+    id_entries = array.array('i', by_row_id)
+
+    by_language = sorted(range(len(documents)), key=lambda n: (
+        entry_languages[n], entry_tables[n], entry_ranks[n]))
+    language_entries = array.array('i', by_language)
+    language_names = array.array('i', [entry_names[n] for n in by_language])
+    language_ranks = array.array('i', [entry_ranks[n] for n in by_language])
+    run_starts = array.array('i')
+    run_languages = array.array('i')
+    run_tables = array.array('i')
+    for position, n in enumerate(by_language):
+        run = entry_languages[n], entry_tables[n]
+        if not run_starts or run != (run_languages[-1], run_tables[-1]):
+            run_starts.append(position)
+            run_languages.append(run[0])
+            run_tables.append(run[1])
+    run_starts.append(len(by_language))
+
+    deletions = sorted(
+        (_hash(deletion), name_number)
+        for name_number, name in enumerate(names)
+        for deletion in _deletions(name[:prefix_length], max_distance))
+    delete_keys = array.array('I', [key for key, name_number in deletions])
+    delete_names = array.array('i', [name_number for key, name_number in deletions])
+
+    name_offsets, name_heap = _encode_text(names)
+    display_offsets, display_heap = _encode_text(
+        [document['display_name'] for document in documents])
+
+    sections = [
+        ('name_offsets', name_offsets),
+        ('name_heap', name_heap),
+        ('name_entry_starts', name_entry_starts),
+        ('name_entries', name_entries),
+        ('display_offsets', display_offsets),
+        ('display_heap', display_heap),
+        ('entry_names', entry_names),
+        ('entry_tables', entry_tables),
+        ('entry_languages', entry_languages),
+        ('entry_row_ids', entry_row_ids),
+        ('entry_ranks', entry_ranks),
+        ('id_row_ids', id_row_ids),
+        ('id_entries', id_entries),
+        ('language_entries', language_entries),
+        ('language_names', language_names),
+        ('language_ranks', language_ranks),
+        ('run_starts', run_starts),
+        ('run_languages', run_languages),
+        ('run_tables', run_tables),
+        ('delete_keys', delete_keys),
+        ('delete_names', delete_names),
+    ]
+
+    header_sections = {}
+    chunks = []
+    position = 0
+    for section_name, data in sections:
+        if isinstance(data, array.array):
+            typecode = data.typecode
+            data = data.tostring() if six.PY2 else data.tobytes()
+        else:
+            typecode = None
+        header_sections[section_name] = [position, len(data), typecode]
+        padding = -len(data) % _align
+        chunks.append(data + b'\0' * padding)
+        position += len(data) + padding
+
+    header = json.dumps(dict(
+        version=VERSION,
+        byteorder=sys.byteorder,
+        itemsizes=dict((typecode, array.array(typecode).itemsize)
+                       for typecode in 'iI'),
+        tables=tables,
+        languages=languages,
+        max_distance=max_distance,
+        prefix_length=prefix_length,
+        sections=header_sections,
+    )).encode('ascii')
+    # Sections start at an aligned offset after the header
+    start = len(MAGIC) + 4 + len(header)
+    header += b' ' * (-start % _align)
+
+    temp_path = '%s.%s.tmp' % (path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for chunk in chunks:
+            f.write(chunk)
+    getattr(os, 'replace', os.rename)(temp_path, path)
+
+
+class _TextArray(object):
+    """Sequence of the strings in an offsets + heap pair of sections, as
+    UTF-8 bytes.  Works with bisect.
+    """
+    def __init__(self, data, offsets, heap_start):
+        self.data = data
+        self.offsets = offsets
+        self.heap_start = heap_start
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, n):
+        start = self.heap_start + self.offsets[n]
+        return self.data[start:self.heap_start + self.offsets[n + 1]]
+
+    def text(self, n):
+        return self[n].decode('utf-8')
+
+
+class NameIndex(object):
+    """A name index file, opened for searching.
+
+    The find_* methods return lists of entry numbers; `records()` filters
+    and ranks them and turns them into dicts with the same fields as the
+    stored fields of the whoosh index.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic = self.mmap[:len(MAGIC)]
+        header_size, = struct.unpack(
+            '<I', self.mmap[len(MAGIC):len(MAGIC) + 4])
+        start = len(MAGIC) + 4
+        try:
+            if magic != MAGIC:
+                raise ValueError
+            header = json.loads(
+                self.mmap[start:start + header_size].decode('ascii'))
+        except ValueError:
+            self.mmap.close()
+            raise IOError("%s is not a name index" % path)
+        start += header_size
+
+        if (header['version'] != VERSION or
+                header['byteorder'] != sys.byteorder or
+                header['itemsizes'] != dict(
+                    (typecode, array.array(typecode).itemsize)
+                    for typecode in 'iI')):
+            self.mmap.close()
+            raise IOError("%s was built by an incompatible version or "
+                          "platform; rebuild the index" % path)
+
+        self.tables = header['tables']
+        self.languages = [tuple(language) for language in header['languages']]
+        self.max_distance = header['max_distance']
+        self.prefix_length = header['prefix_length']
+
+        self._views = []
+        sections = {}
+        for section_name, (offset, length, typecode) in header['sections'].items():
+            offset += start
+            if typecode is None:
+                sections[section_name] = offset
+            elif six.PY2:
+                sections[section_name] = array.array(
+                    str(typecode), self.mmap[offset:offset + length])
+            else:
+                view = memoryview(self.mmap)[offset:offset + length].cast(typecode)
+                self._views.append(view)
+                sections[section_name] = view
+
+        self.names = _TextArray(self.mmap, sections['name_offsets'],
+                                sections['name_heap'])
+        self.display_names = _TextArray(self.mmap, sections['display_offsets'],
+                                        sections['display_heap'])
+        self.name_entry_starts = sections['name_entry_starts']
+        self.name_entries = sections['name_entries']
+        self.entry_names = sections['entry_names']
+        self.entry_tables = sections['entry_tables']
+        self.entry_languages = sections['entry_languages']
+        self.entry_row_ids = sections['entry_row_ids']
+        self.entry_ranks = sections['entry_ranks']
+        self.id_row_ids = sections['id_row_ids']
+        self.id_entries = sections['id_entries']
+        self.language_entries = sections['language_entries']
+        self.language_names = sections['language_names']
+        self.language_ranks = sections['language_ranks']
+        self.run_starts = sections['run_starts']
+        self.run_languages = sections['run_languages']
+        self.run_tables = sections['run_tables']
+        self.delete_keys = sections['delete_keys']
+        self.delete_names = sections['delete_names']
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self.mmap.close()
+
+    def __len__(self):
+        """Returns the number of entries."""
+        return len(self.entry_names)
+
+    ### Finding entries
+
+    def _find_name_number(self, name):
+        encoded = name.encode('utf-8')
+        n = bisect.bisect_left(self.names, encoded)
+        if n < len(self.names) and self.names[n] == encoded:
+            return n
+        return None
+
+    def _name_bounds(self, prefix):
+        """Returns `(start, end)` such that the names starting with `prefix`
+        are the ones numbered from `start` up to `end`.
+        """
+        encoded = prefix.encode('utf-8')
+        start = bisect.bisect_left(self.names, encoded)
+        # No UTF-8 sequence contains 0xff, so this sorts after every name
+        # with the prefix
+        end = bisect.bisect_left(self.names, encoded + b'\xff', start)
+        return start, end
+
+    def _name_range(self, prefix):
+        """Returns the range of name numbers starting with `prefix`."""
+        return range(*self._name_bounds(prefix))
+
+    def _entries_of_names(self, name_numbers):
+        entries = []
+        starts = self.name_entry_starts
+        for n in name_numbers:
+            entries.extend(self.name_entries[starts[n]:starts[n + 1]])
+        return entries
+
+    def frequency(self, name_number):
+        """Returns the number of entries with the given name."""
+        return (self.name_entry_starts[name_number + 1] -
+                self.name_entry_starts[name_number])
+
+    def find_names(self, names):
+        """Returns the entries with any of the given names."""
+        name_numbers = [self._find_name_number(name) for name in names]
+        return self._entries_of_names(n for n in name_numbers if n is not None)
+
+    def find_prefix(self, prefix):
+        """Returns the entries with names starting with `prefix`."""
+        return self._entries_of_names(self._name_range(prefix))
+
+    def find_wildcard(self, pattern):
+        """Returns the entries with names matching `pattern`, where `*`
+        matches any number of characters and `?` matches one.
+        """
+        prefix = re.match(u'[^*?]*', pattern).group()
+        regex = re.compile(u''.join(
+            u'.*' if c == u'*' else u'.' if c == u'?' else re.escape(c)
+            for c in pattern) + u'\\Z', re.DOTALL)
+        names = self.names
+        return self._entries_of_names(
+            n for n in self._name_range(prefix)
+            if regex.match(names.text(n)))
+
+    def find_ids(self, row_id):
+        """Returns the entries for rows with the given id, in any table."""
+        start = bisect.bisect_left(self.id_row_ids, row_id)
+        end = bisect.bisect_right(self.id_row_ids, row_id, start)
+        return self.id_entries[start:end].tolist()
+
+    def suggest(self, text, limit=10):
+        """Returns up to `limit` names that are within `max_distance` edits
+        of `text`, but not `text` itself.
+
+        Like whoosh's corrector, suggestions are ranked by edit distance,
+        then by how many entries have them, then by name.
+        """
+        candidates = set()
+        keys = self.delete_keys
+        for deletion in _deletions(text[:self.prefix_length], self.max_distance):
+            key = _hash(deletion)
+            start = bisect.bisect_left(keys, key)
+            end = bisect.bisect_right(keys, key, start)
+            candidates.update(self.delete_names[start:end].tolist())
+
+        suggestions = []
+        max_distance = self.max_distance
+        for name_number in candidates:
+            name = self.names.text(name_number)
+            if name == text or abs(len(name) - len(text)) > max_distance:
+                continue
+            distance = damerau_levenshtein(text, name, max_distance)
+            if distance <= max_distance:
+                suggestions.append(
+                    (distance, -self.frequency(name_number), name))
+
+        # whoosh keeps the best suggestions in a heap, so among equally good
+        # ones it keeps those that sort last by name, and then lists what it
+        # kept in order.  Do the same, so both backends agree
+        suggestions.sort(key=lambda suggestion: suggestion[2], reverse=True)
+        suggestions.sort(key=lambda suggestion: suggestion[:2])
+        kept = sorted(suggestions[:limit])
+        return [name for distance, frequency, name in kept]
+
+    def complete(self, prefix, languages, table_names=None, limit=10,
+                 after=None):
+        """Returns entries with names starting with `prefix`, `limit` at a
+        time, for completing what someone is typing.
+
+        `languages` is a list of sets of language identifiers.  Entries in the
+        first set's languages come first, then those in the second's, and so
+        on; entries in other languages are left out.  Within a set, entries
+        are in the order results are shown in.  Only the first entry for each
+        row is included.  If `table_names` is given, only entries from those
+        tables are.
+
+        Returns `(entries, position)`.  Pass `position` as `after` to get the
+        entries after these; it's None if there are no more.
+        """
+        first_name, end_name = self._name_bounds(prefix)
+        buckets = {}
+        for bucket, identifiers in enumerate(languages):
+            for n, (identifier, iso639, iso3166) in enumerate(self.languages):
+                if identifier in identifiers:
+                    buckets[n] = bucket
+        tables = set(n for n, table in enumerate(self.tables)
+                     if not table_names or table in table_names)
+
+        language_entries = self.language_entries
+        language_names = self.language_names
+        language_ranks = self.language_ranks
+        entry_names = self.entry_names
+        entry_ranks = self.entry_ranks
+
+        # Names with the prefix are a range of name numbers, and so a slice
+        # of each run of one language and table, in the order they should
+        # come in
+        slices = [[] for identifiers in languages]
+        for run in range(len(self.run_languages)):
+            bucket = buckets.get(self.run_languages[run])
+            if bucket is None or self.run_tables[run] not in tables:
+                continue
+            if after is not None and bucket < after[0]:
+                continue
+
+            start = self.run_starts[run]
+            end = self.run_starts[run + 1]
+            start = bisect.bisect_left(language_names, first_name, start, end)
+            end = bisect.bisect_left(language_names, end_name, start, end)
+            if after is not None and bucket == after[0]:
+                start = bisect.bisect_right(language_ranks, after[1], start, end)
+            if start < end:
+                slices[bucket].append((start, end))
+
+        def ordered():
+            for bucket, bucket_slices in enumerate(slices):
+                for rank, n in heapq.merge(*[
+                        six.moves.zip(language_ranks[start:end],
+                                      language_entries[start:end])
+                        for start, end in bucket_slices]):
+                    yield (bucket, rank), n
+
+        def comes_first(position, n):
+            """Returns whether entry `n` comes first of all the entries for
+            its row that are being completed.
+            """
+            table = self.entry_tables[n]
+            for other in self.find_ids(self.entry_row_ids[n]):
+                if other == n or self.entry_tables[other] != table:
+                    continue
+                bucket = buckets.get(self.entry_languages[other])
+                if (bucket is not None and
+                        (bucket, entry_ranks[other]) < position and
+                        first_name <= entry_names[other] < end_name):
+                    return False
+            return True
+
+        entries = []
+        last_position = None
+        for position, n in ordered():
+            if not comes_first(position, n):
+                continue
+            if len(entries) == limit:
+                # There's at least one more
+                return entries, last_position
+            entries.append(n)
+            last_position = position
+        return entries, None
+
+    ### Turning entries into results
+
+    def records(self, entries, table_names=None, lang_codes=None, limit=None,
+                languages=None):
+        """Returns record dicts for the given entries, in the order results
+        should be shown in (before boosting languages), without duplicates.
+
+        Only entries from `table_names` and in a language with an ISO 639 or
+        3166 code in `lang_codes` are included, if those are given.  At most
+        `limit` records are returned.
+
+        `languages` is a list of sets of language identifiers, as for
+        complete().  If it's given, entries in the first set's languages come
+        first, and so on, with entries in other languages last; that's done
+        before cutting the records down to `limit`.
+        """
+        entries = set(entries)
+        if table_names:
+            tables = set(n for n, table in enumerate(self.tables)
+                         if table in table_names)
+            entry_tables = self.entry_tables
+            entries = [n for n in entries if entry_tables[n] in tables]
+        if lang_codes:
+            allowed = set(
+                n for n, (identifier, iso639, iso3166) in enumerate(self.languages)
+                if iso639 in lang_codes or iso3166 in lang_codes)
+            entry_languages = self.entry_languages
+            entries = [n for n in entries if entry_languages[n] in allowed]
+
+        entry_ranks = self.entry_ranks
+        if languages:
+            priorities = {}
+            for priority, identifiers in enumerate(languages):
+                for n, (identifier, iso639, iso3166) in enumerate(self.languages):
+                    if identifier in identifiers:
+                        priorities[n] = priority
+            entry_languages = self.entry_languages
+            entries = sorted(entries, key=lambda n: (
+                priorities.get(entry_languages[n], len(languages)),
+                entry_ranks[n]))
+        else:
+            entries = sorted(entries, key=entry_ranks.__getitem__)
+        if limit is not None:
+            entries = entries[:limit]
+        return [self.record(n) for n in entries]
+
+    def record(self, n):
+        """Returns the record dict of entry `n`."""
+        language, iso639, iso3166 = self.languages[self.entry_languages[n]]
+        return dict(
+            name=self.names.text(self.entry_names[n]),
+            display_name=self.display_names.text(n),
+            table=self.tables[self.entry_tables[n]],
+            row_id=six.text_type(self.entry_row_ids[n]),
+            language=language,
+            iso639=iso639,
+            iso3166=iso3166,
+        )
@@ -0,0 +1,424 @@
+# Encoding: UTF-8
+
+import csv
+import json
+import os
+
+import pytest
+from sqlalchemy import MetaData, and_, create_engine, inspect
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import pokedex.db
+from pokedex.db import csvcache, load, tables
+from pokedex.db.dependencies import compute_dependency_levels
+from pokedex.defaults import get_default_csv_dir
+
+@pytest.fixture
+def empty_session():
+    engine = create_engine('sqlite://')
+    return sessionmaker(bind=engine)()
+
+@pytest.fixture(scope="module")
+def scratch_session(request):
+    import pokedex.db
+    engine_uri = request.config.getvalue("load_engine")
+    if not engine_uri:
+        raise pytest.skip("No scratch database (use --load-engine)")
+    return pokedex.db.connect(engine_uri, local_infile=True)
+
+def test_dependency_levels():
+    all_tables = list(tables.metadata.tables.values())
+    levels = compute_dependency_levels(all_tables)
+    assert sorted(t.name for level in levels for t in level) == \
+        sorted(t.name for t in all_tables)
+
+    level_of = {}
+    for n, level in enumerate(levels):
+        for table in level:
+            level_of[table] = n
+    for table in all_tables:
+        for fkey in table.foreign_keys:
+            parent = fkey.column.table
+            if parent is not table:
+                assert level_of[parent] < level_of[table], (parent, table)
+
+@pytest.mark.parametrize('safe', [True, False])
+def test_load_subset(empty_session, safe):
+    load.load(empty_session, tables=['languages', 'language_names'],
+              recursive=False, langs=[], safe=safe)
+    english = empty_session.query(tables.Language).get(9)
+    assert english.identifier == u'en'
+    assert english.official is True
+    names = empty_session.query(tables.Language.names_table).count()
+    assert names > 0
+
+    # Indexes are created after the data is loaded
+    indexes = inspect(empty_session.get_bind()).get_indexes('language_names')
+    assert [index['column_names'] for index in indexes] == [['name']]
+
+def test_incremental_load(empty_session, tmpdir):
+    csv_dir = get_default_csv_dir()
+    for name in ('languages', 'language_names'):
+        with open(os.path.join(csv_dir, name + '.csv'), 'rb') as f:
+            tmpdir.join(name + '.csv').write_binary(f.read())
+
+    names_table = tables.Language.names_table.__table__
+    english_name = names_table.select().where(and_(
+        names_table.c.language_id == 9,
+        names_table.c.local_language_id == 9))
+
+    def load_incrementally():
+        load.load(empty_session, tables=['languages', 'language_names'],
+                  directory=str(tmpdir), recursive=False, langs=[],
+                  incremental=True)
+        return empty_session.execute(english_name).fetchone().name
+
+    assert load_incrementally() == u'English'
+
+    # Nothing changed; the tables are left alone
+    empty_session.execute(names_table.update().values(name=u'Unchanged'))
+    empty_session.commit()
+    assert load_incrementally() == u'Unchanged'
+
+    # A changed CSV gets reloaded
+    names_csv = tmpdir.join('language_names.csv')
+    names_csv.write_binary(names_csv.read_binary().replace(
+        b'9,9,English', b'9,9,Changed'))
+    assert load_incrementally() == u'Changed'
+
+def test_failed_load_unlocks_database(tmpdir):
+    """An unsafe load into SQLite locks the database while it runs, and lets
+    go of it even when the load fails.
+    """
+    tmpdir.join('languages.csv').write_binary(
+        b'id,iso639,iso3166,identifier,official,order\n'
+        b'not a number,en,us,en,1,1\n')
+    path = str(tmpdir.join('pokedex.sqlite'))
+    session = sessionmaker(bind=create_engine('sqlite:///' + path))()
+    with pytest.raises(ValueError):
+        load.load(session, tables=['languages'], directory=str(tmpdir),
+                  recursive=False, langs=[], safe=False)
+
+    other = create_engine('sqlite:///' + path,
+                          connect_args=dict(timeout=0)).connect()
+    try:
+        other.execute("CREATE TABLE unlocked (id INTEGER)")
+        assert other.execute("PRAGMA journal_mode").scalar() == 'delete'
+    finally:
+        other.close()
+
+def test_row_converter():
+    table = tables.Language.__table__
+    convert_row = load._get_row_converter(
+        table, ['id', 'iso639', 'official', 'order'])
+    assert convert_row(['9', 'en', '1', '']) == (9, u'en', True, None)
+    assert convert_row(['1', 'ja', '0', '3']) == (1, u'ja', False, 3)
+
+def test_csv_progress_reader(tmpdir):
+    path = tmpdir.join('prose.csv')
+    path.write_binary(u'id,text\n1,"two\nlines"\n2,Pokémon\n'.encode('utf-8'))
+    with open(str(path), 'rb') as f:
+        lines = load._CSVProgressReader(f)
+        reader = csv.reader(lines, lineterminator='\n')
+        assert next(reader) == ['id', 'text']
+        assert next(reader) == ['1', 'two\nlines']
+        assert lines.progress() == '66%'
+        assert next(reader) == ['2', u'Pokémon']
+        assert lines.progress() == '100%'
+        assert lines.hexdigest() == csvcache.hash_file(str(path))
+
+@pytest.mark.parametrize('safe', [True, False])
+def test_csv_hashes_recorded(empty_session, monkeypatch, safe):
+    """A plain load hashes the CSV files as it reads them, and records the
+    hashes for the next incremental load.
+    """
+    hashed = []
+    hash_file = csvcache.hash_file
+    def record_hash_file(path):
+        hashed.append(os.path.basename(path))
+        return hash_file(path)
+    monkeypatch.setattr(csvcache, 'hash_file', record_hash_file)
+
+    load.load(empty_session, tables=['languages', 'language_names'],
+              recursive=False, langs=[], safe=safe)
+    assert hashed == []
+
+    csv_dir = get_default_csv_dir()
+    recorded = dict(empty_session.execute(
+        load.csv_hashes_table.select()).fetchall())
+    assert sorted(recorded) == ['language_names.csv', 'languages.csv']
+    for filename, sha1 in recorded.items():
+        assert sha1 == hash_file(os.path.join(csv_dir, filename))
+
+@pytest.mark.parametrize('safe', [True, False])
+def test_load_into_scratch_database(scratch_session, empty_session, safe):
+    """Load into the --load-engine database, with and without its fast path
+    (e.g. MySQL's LOAD DATA LOCAL INFILE), and compare with SQLite.
+
+    pokemon_species refers to itself, with Pokémon that evolve from ones
+    later in the file.
+    """
+    table_names = ['languages', 'language_names', 'regions', 'generations',
+                   'version_groups', 'versions', 'version_names',
+                   'item_pockets', 'item_categories', 'item_fling_effects',
+                   'items', 'evolution_chains', 'growth_rates',
+                   'pokemon_colors', 'pokemon_habitats', 'pokemon_shapes',
+                   'pokemon_species']
+    load.load(scratch_session, tables=table_names, recursive=False,
+              drop_tables=True, safe=safe, langs=[])
+    load.load(empty_session, tables=table_names, recursive=False, langs=[])
+
+    for table_name in table_names:
+        table = tables.metadata.tables[table_name]
+        query = table.select().order_by(*table.primary_key)
+        expected = [tuple(row) for row in empty_session.execute(query)]
+        assert [tuple(row) for row in scratch_session.execute(query)] == expected
+
+def test_sort_self_referential_rows():
+    # (id, parent_id), with a chain three levels deep and a self-reference
+    rows = [(1, None), (2, 4), (3, 1), (4, 5), (5, 3), (6, 6)]
+    ordered = list(load._sort_self_referential_rows(rows, 0, [1]))
+    assert sorted(ordered) == sorted(rows)
+    position = dict((row[0], n) for n, row in enumerate(ordered))
+    for id, parent_id in rows:
+        if parent_id is not None:
+            assert position[parent_id] <= position[id]
+
+    with pytest.raises(ValueError):
+        list(load._sort_self_referential_rows([(1, 2), (2, 1)], 0, [1]))
+    with pytest.raises(ValueError):
+        list(load._sort_self_referential_rows([(1, 7)], 0, [1]))
+
+def test_dump(empty_session, tmpdir):
+    load.load(empty_session, tables=['languages', 'language_names'],
+              recursive=False, langs=[])
+    load.dump(empty_session, tables=['languages', 'language_names'],
+              directory=str(tmpdir), langs=[])
+
+    with open(os.path.join(get_default_csv_dir(), 'languages.csv'), 'rb') as f:
+        assert tmpdir.join('languages.csv').read_binary() == f.read()
+
+    # Names are only dumped for official languages and those in `langs`
+    official_ids = set(language.id for language
+                       in empty_session.query(tables.Language)
+                       if language.official)
+    with open(str(tmpdir.join('language_names.csv'))) as f:
+        rows = list(csv.DictReader(f))
+    assert rows
+    assert set(int(row['local_language_id']) for row in rows) <= official_ids
+
+def test_parallel_load_and_dump(tmpdir):
+    """Load, index and dump tables with two worker threads each.
+
+    SQLite always does these one at a time, so this calls the parallel
+    helpers directly, against a file that each thread connects to.
+    """
+    table_names = ['languages', 'language_names', 'regions', 'region_names',
+                   'generations', 'generation_names']
+    table_objs = [tables.metadata.tables[name] for name in table_names]
+    csv_dir = get_default_csv_dir()
+    engine = create_engine('sqlite:///' + str(tmpdir.join('pokedex.sqlite')),
+                           connect_args=dict(timeout=60))
+
+    indexes = []
+    for table in table_objs:
+        indexes.extend(load._create_table_without_indexes(table, engine))
+    assert indexes
+
+    def load_table(session, table_obj, print_status):
+        return load._load_table(session, table_obj, print_status,
+                                directory=csv_dir, safe=True, oracle=False,
+                                batch_size=100)
+    loaded = []
+    load._load_tables_parallel(engine, table_objs, load_table, 2,
+                               loaded.append, lambda msg='ok': None)
+    assert sorted(loaded) == sorted(table_names)
+
+    created = []
+    load._create_indexes(engine, indexes, 2, created.append,
+                         lambda msg='ok': None)
+    assert sorted(created) == sorted('Index %s' % index.name
+                                     for index in indexes)
+    assert inspect(engine).get_indexes('language_names')
+
+    def dump_table(connection, table_name, print_status):
+        filename = str(tmpdir.join(table_name + '.csv'))
+        table = tables.metadata.tables[table_name]
+        return table_name, load._dump_table(connection, table, filename,
+                                            None, print_status)
+    dumped = []
+    load._dump_tables_parallel(engine, table_names, dump_table, 2,
+                               dumped.append, lambda msg='ok': None)
+    assert sorted(dumped) == sorted(table_names)
+
+    # Every row made it in and back out again
+    for table_name in table_names:
+        with open(os.path.join(csv_dir, table_name + '.csv'), 'rb') as f:
+            assert tmpdir.join(table_name + '.csv').read_binary() == f.read()
+
+def test_load_profile(empty_session, tmpdir):
+    report_path = tmpdir.join('report.json')
+    load.load(empty_session, tables=['languages', 'language_names'],
+              recursive=False, langs=[], profile=str(report_path))
+
+    report = json.loads(report_path.read())
+    assert report['dialect'] == 'sqlite'
+    phases = dict((phase.get('table', phase['phase']), phase)
+                  for phase in report['phases'])
+    assert phases['languages']['phase'] == 'insert'
+    assert phases['languages']['rows'] == \
+        empty_session.query(tables.Language).count()
+    assert phases['languages']['bytes'] > 0
+    assert phases['languages']['commits'] >= 1
+    for phase in ('create', 'translations', 'indexes', 'integrity_check'):
+        assert phase in phases
+
+def test_derived_tables(empty_session, tmpdir):
+    csv_dir = get_default_csv_dir()
+    for name in ('languages', 'version_groups', 'pokemon_move_methods'):
+        with open(os.path.join(csv_dir, name + '.csv'), 'rb') as f:
+            tmpdir.join(name + '.csv').write_binary(f.read())
+    tmpdir.join('pokemon_moves.csv').write_binary(
+        b'pokemon_id,version_group_id,move_id,pokemon_move_method_id,level,order\n'
+        b'1,1,33,1,1,\n'
+        b'1,1,45,1,1,\n'
+        b'1,5,14,4,0,\n')
+    tmpdir.join('version_group_pokemon_move_methods.csv').write_binary(
+        b'version_group_id,pokemon_move_method_id\n')
+
+    load.load(empty_session, directory=str(tmpdir), recursive=False, langs=[],
+              tables=['version_groups', 'pokemon_move_methods',
+                      'pokemon_moves', 'version_group_pokemon_move_methods'])
+    VGPMM = tables.VersionGroupPokemonMoveMethod
+    rows = empty_session.query(VGPMM.version_group_id,
+                               VGPMM.pokemon_move_method_id)
+    assert sorted(rows) == [(1, 1), (5, 4)]
+
+    # pokemon_moves is reloaded as a dependent of pokemon, which isn't a
+    # source itself; what counts is what was actually loaded
+    tmpdir.join('pokemon_moves.csv').write_binary(
+        b'pokemon_id,version_group_id,move_id,pokemon_move_method_id,level,order\n'
+        b'1,2,33,1,1,\n')
+    load.load(empty_session, directory=str(tmpdir), langs=[],
+              tables=['pokemon'], drop_tables=True)
+    assert sorted(rows) == [(2, 1)]
+
+def test_csv_cache(tmpdir):
+    path = str(tmpdir.join('test.cache'))
+    rows = [(1, True, u'Pokémon'), (2, None, u''), (None, False, None)]
+    csvcache.build_cache(path, u'1234', ['id', 'flag', 'text'],
+                         [csvcache.INTEGER, csvcache.BOOLEAN, csvcache.TEXT],
+                         iter(rows))
+    with csvcache.open_cache(path, u'1234') as cache:
+        assert cache.column_names == ['id', 'flag', 'text']
+        assert list(cache.iter_batches(2)) == [rows[:2], rows[2:]]
+        assert cache.progress() == '100%'
+
+    # A changed CSV file invalidates the cache
+    assert csvcache.open_cache(path, u'5678') is None
+    assert csvcache.open_cache(path, u'1234', [csvcache.TEXT] * 3) is None
+
+@pytest.mark.parametrize('safe', [True, False])
+def test_load_from_cache(tmpdir, safe):
+    table_names = ['languages', 'language_names', 'regions', 'region_names']
+    cache_dir = str(tmpdir.join('cache'))
+
+    def load_with_cache():
+        session = sessionmaker(bind=create_engine('sqlite://'))()
+        load.load(session, tables=table_names, recursive=False,
+                  cache_dir=cache_dir, safe=safe)
+        return session
+
+    # Once to build the cache, once to read it
+    expected = load_with_cache()
+    assert os.path.exists(os.path.join(cache_dir, 'languages.cache'))
+    assert os.path.exists(os.path.join(cache_dir, 'translations', 'cs.cache'))
+    session = load_with_cache()
+    for table_name in table_names:
+        table = tables.metadata.tables[table_name]
+        query = table.select().order_by(*table.primary_key)
+        assert [tuple(row) for row in session.execute(query)] == \
+            [tuple(row) for row in expected.execute(query)]
+
+    cs = session.query(tables.Language).filter_by(identifier=u'cs').one()
+    assert session.query(tables.Region.names_table).filter_by(
+        local_language_id=cs.id).count() > 0
+
+def test_build_sqlite(tmpdir):
+    path = str(tmpdir.join('pokedex.sqlite'))
+    load.build_sqlite(path, tables=['languages', 'language_names'],
+                      langs=[], page_size=16384)
+
+    session = pokedex.db.connect('sqlite:///' + path, read_only=True)
+    assert session.execute("PRAGMA page_size").scalar() == 16384
+    assert session.execute("PRAGMA journal_mode").scalar() == 'delete'
+    assert session.execute("SELECT count(*) FROM sqlite_stat1").scalar() > 0
+    assert session.query(tables.Language).get(9).identifier == u'en'
+
+    with pytest.raises(OperationalError):
+        session.execute(tables.Language.__table__.delete())
+    session.rollback()
+
+def test_connect_local_infile(monkeypatch):
+    """MySQL connections only allow LOAD DATA LOCAL INFILE when asked to."""
+    urls = []
+    def engine_from_config(config, prefix):
+        urls.append(config[prefix + 'url'])
+        return create_engine('sqlite://')
+    monkeypatch.setattr(pokedex.db, 'engine_from_config', engine_from_config)
+    monkeypatch.setattr(pokedex.db, 'metadata', MetaData())
+
+    pokedex.db.connect('mysql://pokedex@localhost/pokedex')
+    pokedex.db.connect('mysql://pokedex@localhost/pokedex', local_infile=True)
+    assert urls == [
+        'mysql://pokedex@localhost/pokedex?charset=utf8',
+        'mysql://pokedex@localhost/pokedex?charset=utf8&local_infile=1',
+    ]
+
+def test_create_table_without_indexes():
+    engine = create_engine('sqlite://')
+    table = tables.PokemonSpecies.__table__
+    indexes = set(table.indexes)
+    assert indexes
+
+    deferred = load._create_table_without_indexes(table, engine)
+    assert set(deferred) == indexes
+    assert not inspect(engine).get_indexes(table.name)
+
+    # The shared metadata is never touched, even when creating fails
+    with pytest.raises(OperationalError):
+        load._create_table_without_indexes(table, engine)
+    assert table.indexes == indexes
+
+@pytest.mark.parametrize('table', [tables.PokemonEvolution.__table__,
+                                   tables.PokemonSpecies.__table__])
+def test_create_table_without_indexes_postgresql(table):
+    # The same DDL as table.create(), including the ENUM type it needs on
+    # PostgreSQL, except for the indexes
+    def ddl(create):
+        statements = []
+        def executor(sql, *multiparams, **params):
+            statements.append(str(sql.compile(dialect=engine.dialect)).strip())
+        engine = create_engine('postgresql://', strategy='mock',
+                               executor=executor)
+        create(engine)
+        return statements
+
+    statements = ddl(lambda engine: load._create_table_without_indexes(
+        table, engine))
+    expected = [statement for statement in ddl(table.create)
+                if not statement.startswith('CREATE INDEX')]
+    assert statements == expected
+    if table.name == 'pokemon_evolution':
+        assert statements[0].startswith(
+            'CREATE TYPE pokemon_evolution_time_of_day AS ENUM')
+
+def test_relationship_indexes():
+    indexes = load._get_relationship_indexes()
+    columns = set((index.table.name, tuple(c.name for c in index.columns))
+                  for index in indexes)
+    # Pokemon.types, through pokemon_types, from the types side
+    assert ('pokemon_types', ('type_id', 'pokemon_id')) in columns
+    # Already covered by the primary key
+    assert ('language_names', ('language_id', 'local_language_id')) not in columns
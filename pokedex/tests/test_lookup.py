@@ -1,6 +1,20 @@
 # Encoding: UTF-8
 
+import io
+import os
+import shutil
+import weakref
+
 import pytest
+import whoosh.fields
+import whoosh.index
+import whoosh.query
+import whoosh.sorting
+from sqlalchemy import event
+
+import pokedex.lookup
+from pokedex import nameindex
+from pokedex.db import tables
 parametrize = pytest.mark.parametrize
 
 @parametrize(
@@ -107,6 +121,26 @@ def test_fuzzy_lookup(lookup, misspelling, name):
     assert first_result.object.name == name
 
 
+@parametrize(
+    ('misspelling', 'names'),
+    [
+        (u'pikchu', [(u'Pikachu', u'en'), (u'Pichu', u'en')]),
+        (u'evee', [(u'Eevee', u'en'), (u'Ekei', u'en'), (u'Melee', u'en')]),
+        (u'sur', [(u'Surf', u'en'), (u'Sōun', u'en'), (u'Tsuru', u'en')]),
+    ]
+)
+@parametrize('backend', pokedex.lookup.PokedexLookup.backends)
+def test_fuzzy_order(lookup, backend, misspelling, names):
+    # Closer names in the current locale come first, however many hits
+    # there are in other languages
+    lookup = pokedex.lookup.PokedexLookup(lookup.directory, lookup.session,
+                                          backend=backend)
+    results = lookup.lookup(misspelling)
+    assert [(result.name, result.language.identifier)
+            for result in results[:len(names)]] == names
+    assert not any(result.exact for result in results)
+
+
 def test_nidoran(lookup):
     results = lookup.lookup(u'Nidoran')
     top_names = [result.object.name for result in results[0:2]]
@@ -150,7 +184,472 @@ def test_qualified_random(lookup, table_name):
     assert results[0].object.__tablename__ == table_name
 
 
+def test_random_many(lookup):
+    valid_types = [u'types', u'pokemon_species']
+    species_count = len(lookup._get_ids(u'pokemon_species'))
+    type_count = len(lookup._get_ids(u'types'))
+
+    # One table, then one row: types come up about half the time
+    results = lookup.random_lookup(valid_types, n=400)
+    assert len(results) == 400
+    types = sum(result.object.__tablename__ == u'types' for result in results)
+    assert 120 < types < 280
+
+    # Every row is equally likely
+    results = lookup.random_lookup(valid_types, n=400, weighted=True)
+    types = sum(result.object.__tablename__ == u'types' for result in results)
+    assert types < 400 * 4 * type_count // (type_count + species_count)
+
+
 def test_crash_empty_prefix(lookup):
     """Searching for ':foo' used to crash, augh!"""
     results = lookup.lookup(u':Eevee')
     assert results[0].object.name == u'Eevee'
+
+
+def test_lookup_query_count(lookup):
+    # Results are fetched with one query per table, however many there are
+    engine = lookup.session.get_bind()
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    lookup.lookup(u'eevee')
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        results = lookup.lookup(u'a*')
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    tables = set(result.object.__tablename__ for result in results)
+    assert len(results) > 20
+    assert len(statements) <= len(tables) + 1
+
+
+def test_searcher_pool(tmpdir):
+    schema = whoosh.fields.Schema(name=whoosh.fields.ID(stored=True))
+    index = whoosh.index.create_in(str(tmpdir), schema=schema)
+    def add(name):
+        writer = index.writer()
+        writer.add_document(name=name)
+        writer.commit()
+    add(u'eevee')
+
+    pool = pokedex.lookup.SearcherPool(index)
+    with pool.searcher() as searcher:
+        assert searcher.doc_count() == 1
+    with pool.searcher() as searcher:
+        assert searcher.doc_count() == 1
+        # Another thread gets its own searcher
+        other = pool.acquire()
+        assert other is not searcher
+        pool.release(other)
+    assert pool.stats() == dict(opened=2, refreshed=0, idle=2, in_use=0)
+
+    # Changing the index refreshes the searchers as they're taken out
+    add(u'vaporeon')
+    with pool.searcher() as searcher:
+        assert searcher.doc_count() == 2
+    assert pool.stats()['refreshed'] == 1
+
+    pool.reset(index)
+    assert pool.stats()['idle'] == 0
+
+
+def test_boost_languages():
+    hits = [
+        dict(name=u'a', language=u'fr'),
+        dict(name=u'b', language=u'en'),
+        dict(name=u'c', language=u'roomaji'),
+        dict(name=u'd', language=u'de'),
+        dict(name=u'e', language=u'en'),
+    ]
+    boosted = pokedex.lookup.boost_languages(hits, u'en')
+    assert [hit['name'] for hit in boosted] == list(u'becad')
+
+    boosted = pokedex.lookup.boost_languages(hits, u'en', dict(d=3.0))
+    assert [hit['name'] for hit in boosted] == list(u'dbeca')
+
+
+def test_lookup_order(lookup):
+    # Pokémon come before moves, whatever order the index has them in
+    results = lookup.lookup(u'1')
+    tables = [result.object.__tablename__ for result in results]
+    assert tables[0] == 'pokemon_species'
+    assert tables.index('moves') < tables.index('abilities')
+
+
+@parametrize(
+    ('kind', 'value', 'limit'),
+    [
+        ('wildcard', u'pi*', 86),
+        ('wildcard', u'a*', 86),
+        ('wildcard', u'*on', 86),
+        ('wildcard', u's???', 86),
+        ('prefix', u'pi', 10),
+        ('prefix', u'ch', 10),
+    ]
+)
+@parametrize('backend', pokedex.lookup.PokedexLookup.backends)
+def test_ranking_matches_language_facet(lookup, backend, kind, value, limit):
+    # Truncating doesn't lose names in the locale: the results are the ones
+    # sorting the slow way, on LanguageFacet, would give
+    locale = lookup._get_current_locale()
+    facet = whoosh.sorting.MultiFacet([
+        pokedex.lookup.LanguageFacet(locale.identifier),
+        pokedex.lookup.table_facet,
+        "name",
+    ])
+    if kind == 'wildcard':
+        query = whoosh.query.Wildcard(u'name', value)
+    else:
+        query = whoosh.query.Prefix(u'name', value)
+    with lookup.searchers.searcher() as searcher:
+        expected = [(hit['table'], hit['row_id'], hit['name'], hit['language'])
+                    for hit in searcher.search(query, limit=limit,
+                                               sortedby=facet)]
+
+    ranked = pokedex.lookup.PokedexLookup(lookup.directory, lookup.session,
+                                          backend=backend)
+    records = ranked._find(kind, value, [], [], locale, limit=limit)
+    assert [(record['table'], record['row_id'], record['name'],
+             record['language']) for record in records] == expected
+    assert records[0]['language'] == locale.identifier
+
+
+def test_name_index(tmpdir):
+    def document(name, table, row_id, language, sort_key):
+        return dict(name=name, display_name=name.title(), table=table,
+                    row_id=row_id, language=language, iso639=language,
+                    iso3166=u'', sort_key=sort_key)
+    path = str(tmpdir.join('names'))
+    nameindex.build_name_index(path, [
+        document(u'eevee', u'pokemon_species', u'133', u'en', 2),
+        document(u'evoli', u'pokemon_species', u'133', u'fr', 2),
+        document(u'eevee', u'items', u'7', u'en', 9),
+        document(u'ember', u'moves', u'52', u'en', 5),
+        document(u'charge', u'moves', u'268', u'en', 4),
+        document(u'charge', u'moves', u'33', u'fr', 4),
+    ])
+
+    names = nameindex.NameIndex(path)
+    try:
+        def found(entries, *args):
+            return [(record['table'], record['row_id'], record['name'])
+                    for record in names.records(entries, *args)]
+
+        assert len(names) == 6
+        assert found(names.find_names([u'eevee'])) == [
+            (u'pokemon_species', u'133', u'eevee'), (u'items', u'7', u'eevee')]
+        assert found(names.find_names([u'charge']), [], [u'fr']) == [
+            (u'moves', u'33', u'charge')]
+        assert found(names.find_prefix(u'e'), [u'moves']) == [
+            (u'moves', u'52', u'ember')]
+        assert found(names.find_wildcard(u'e*e?')) == [
+            (u'pokemon_species', u'133', u'eevee'),
+            (u'moves', u'52', u'ember'), (u'items', u'7', u'eevee')]
+        assert found(names.find_ids(133)) == [
+            (u'pokemon_species', u'133', u'eevee'),
+            (u'pokemon_species', u'133', u'evoli')]
+        assert names.find_ids(1) == []
+        assert names.records([0])[0]['display_name'] == u'Eevee'
+
+        # Nearest first
+        assert names.suggest(u'embee') == [u'ember', u'eevee']
+        assert names.suggest(u'embee', limit=1) == [u'ember']
+        assert names.suggest(u'chargr') == [u'charge']
+        assert names.suggest(u'eevee') == []
+
+        # Completions come by language, then rank, once per row
+        def completed(*args, **kwargs):
+            entries, position = names.complete(*args, **kwargs)
+            return [names.record(n)['name'] for n in entries], position
+        assert completed(u'e', [set([u'en'])]) == (
+            [u'eevee', u'ember', u'eevee'], None)
+        assert completed(u'e', [set([u'fr']), set([u'en'])]) == (
+            [u'evoli', u'ember', u'eevee'], None)
+        assert completed(u'e', [set([u'en'])], [u'moves']) == ([u'ember'], None)
+        assert completed(u'x', [set([u'en'])]) == ([], None)
+        entries, position = names.complete(u'e', [set([u'fr']), set([u'en'])],
+                                           limit=1)
+        assert completed(u'e', [set([u'fr']), set([u'en'])],
+                         after=position) == ([u'ember', u'eevee'], None)
+    finally:
+        names.close()
+
+
+@parametrize(
+    'input',
+    [u'eevee', u'@fr:charge', u'pokemon:133', u'133', u'a*', u'?ulba*',
+     u'evee', u'char', u'pikchu', u'type:1', u'xyzzy'],
+)
+def test_native_backend(lookup, input):
+    # The native backend finds the same things, in the same order
+    native = pokedex.lookup.PokedexLookup(lookup.directory, lookup.session,
+                                          backend='native')
+    def found(results):
+        return [(result.object, result.name, result.language, result.exact)
+                for result in results]
+
+    assert found(native.lookup(input)) == found(lookup.lookup(input))
+    assert (found(native.prefix_lookup(input[:3])) ==
+            found(lookup.prefix_lookup(input[:3])))
+
+
+def test_make_documents():
+    documents = pokedex.lookup._make_documents((u'types', [
+        (1, u'Normal', u'en', u'en', u'us'),
+        (1, u'ノーマル', u'ja-Hrkt', u'ja', u'jp'),
+        (1, u'', u'fr', u'fr', u'fr'),
+        (2, u'Eévée', u'fr', u'fr', u'fr'),
+    ]))
+    assert [(document['row_id'], document['name'], document['display_name'])
+            for document in documents] == [
+        (u'1', u'normal', u'Normal'),
+        (u'1', u'ノーマル', u'ノーマル'),
+        (u'1', u'noomaru', u'noomaru'),
+        (u'2', u'eevee', u'Eévée'),
+    ]
+
+
+@parametrize('table_name', ['types', 'pokemon_forms'])
+def test_get_names(lookup, table_name):
+    # One query gets the same names as going through every row's name_map
+    cls = lookup.indexed_tables[table_name]
+    name_map = 'pokemon_name_map' if table_name == 'pokemon_forms' else 'name_map'
+    expected = []
+    for row in lookup.session.query(cls).order_by(cls.id):
+        for language, name in getattr(row, name_map).items():
+            expected.append((row.id, name, language.identifier,
+                             language.iso639, language.iso3166))
+    assert sorted(lookup._get_names(cls), key=repr) == sorted(expected, key=repr)
+
+
+@pytest.mark.slow
+def test_rebuild_index_parallel(tmpdir, lookup):
+    parallel = pokedex.lookup.PokedexLookup(str(tmpdir), lookup.session)
+    parallel.rebuild_index(jobs=2)
+    for input in u'eevee', u'1', u'a*', u'pikchu':
+        assert parallel.lookup(input) == lookup.lookup(input)
+
+
+def test_incremental_reindex(tmpdir, lookup):
+    directory = str(tmpdir.join('index'))
+    shutil.copytree(lookup.directory, directory)
+    updated = pokedex.lookup.PokedexLookup(directory, lookup.session,
+                                           backend='native', cache_size=10)
+    # Lookups elsewhere, as if in another process, see the changes too
+    others = [pokedex.lookup.PokedexLookup(directory, lookup.session,
+                                           backend=backend)
+              for backend in pokedex.lookup.PokedexLookup.backends]
+    for other in others:
+        assert other.lookup(u'eevee', valid_types=[u'@en'], exact_only=True)
+    english = lookup.session.query(tables.Language).filter_by(identifier=u'en').one()
+    eevee = lookup.session.query(tables.PokemonSpecies).get(133)
+    try:
+        eevee.names[english].name = u'Aaaeevee'
+        lookup.session.flush()
+
+        # The old index is still searchable while it's being updated, and
+        # what's found then isn't cached past the update
+        get_documents = updated._get_documents
+        def get_documents_and_look_up(*args):
+            documents = get_documents(*args)
+            assert updated.lookup(u'eevee', valid_types=[u'@en'])
+            return documents
+        updated._get_documents = get_documents_and_look_up
+        old_names = updated.names
+        with updated.searchers.searcher() as searcher:
+            updated.rebuild_index(incremental=True)
+            assert searcher.document(name=u'eevee', language=u'en')
+        del updated._get_documents
+        assert not updated.lookup(u'eevee', valid_types=[u'@en'])[0].exact
+        # The replaced name index still works for whoever has it, and is
+        # unmapped once they let go of it
+        assert updated.names is not old_names
+        assert old_names.find_names([u'eevee'])
+        old_mmap = weakref.ref(old_names.mmap)
+        del old_names
+        assert old_mmap() is None
+
+        for other in others:
+            assert [result.object for result in other.lookup(u'aaaeevee')] == [eevee]
+            assert not other.lookup(u'eevee', valid_types=[u'@en'], exact_only=True)
+            # Including spelling corrections
+            assert u'aaaeevee' in other._suggest(u'aaaeeve', limit=10)
+
+        for backend in pokedex.lookup.PokedexLookup.backends:
+            updated.backend = backend
+            assert [result.object for result in updated.lookup(u'aaaeevee')] == [eevee]
+            assert not updated.lookup(u'eevee', valid_types=[u'@en'], exact_only=True)
+            # The new name is ranked among the old ones
+            names = [result.indexed_name for result in updated.lookup(
+                u'a*', valid_types=[u'pokemon_species', u'@en'])]
+            assert u'aaaeevee' in names
+            assert names == sorted(names)
+    finally:
+        lookup.session.rollback()
+
+
+def test_lookup_many(lookup):
+    inputs = [u'eevee', u'Eevee', u'pikchu', u'133', u'@fr:charge',
+              u'xyzzy', u'EEVEE ', u'a*']
+    results = lookup.lookup_many(inputs)
+    assert len(results) == len(inputs)
+    for input, input_results in zip(inputs, results):
+        assert input_results == lookup.lookup(input)
+
+    # Randoms are looked up one by one
+    results = lookup.lookup_many([u'random', u'random'], valid_types=[u'type'])
+    assert all(len(result) == 1 for result in results)
+
+
+def test_lookup_many_query_count(lookup):
+    # The objects for all the results are fetched with one query per table
+    engine = lookup.session.get_bind()
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    inputs = [u'eevee', u'surf', u'master ball', u'1', u'mr. mime'] * 10
+    lookup.lookup_many(inputs)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        results = lookup.lookup_many(inputs)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    tables = set(result.object.__tablename__
+                 for input_results in results for result in input_results)
+    assert len(statements) <= len(tables) + 1
+
+
+def test_result_cache():
+    cache = pokedex.lookup.ResultCache(max_size=2)
+    cache.put(u'a', 1)
+    cache.put(u'b', 2)
+    assert cache.get(u'a') == 1
+    # b is now the least recently used
+    cache.put(u'c', 3)
+    assert cache.get(u'b') is None
+    assert cache.get(u'c') == 3
+    assert cache.stats() == dict(hits=2, misses=1, size=2)
+
+    cache.clear()
+    assert cache.get(u'a') is None
+
+    cache = pokedex.lookup.ResultCache(ttl=0)
+    cache.put(u'a', 1)
+    assert cache.get(u'a') is None
+
+
+def test_lookup_cache(lookup):
+    cached = pokedex.lookup.PokedexLookup(lookup.directory, lookup.session,
+                                          cache_size=10)
+    for i in range(3):
+        assert cached.lookup(u'Eevee') == lookup.lookup(u'eevee')
+        assert cached.lookup(u'pikchu') == lookup.lookup(u'pikchu')
+    assert cached.lookup(u'eevee', exact_only=True) == lookup.lookup(u'eevee')
+    assert cached.lookup(u'pokemon:eevee') == lookup.lookup(u'pokemon:eevee')
+    assert cached.cache.stats() == dict(hits=4, misses=4, size=4)
+
+    # Only rows are cached; objects come from the session every time
+    engine = lookup.session.get_bind()
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        lookup.session.expire_all()
+        assert cached.lookup(u'eevee')[0].object.name == u'Eevee'
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert statements
+
+
+def test_complete(lookup):
+    completions, cursor = lookup.complete(u'ee', limit=3)
+    assert [completion.name for completion in completions] == [
+        u'Eelektrik', u'Eelektross', u'Eevee']
+    assert completions[2] == pokedex.lookup.Completion(
+        name=u'Eevee', indexed_name=u'eevee', table=u'pokemon_species',
+        id=133, language=u'en', iso639=u'en', iso3166=u'us')
+
+    # Names in the locale come first, ordered like lookup results
+    completions, cursor = lookup.complete(u'b', limit=1000)
+    assert cursor is None
+    order = [pokedex.lookup._table_order[completion.table]
+             for completion in completions if completion.language == u'en']
+    assert order == sorted(order)
+    assert completions[0].language == u'en'
+    assert completions[-1].language != u'en'
+
+    # Each row only once
+    rows = [(completion.table, completion.id) for completion in completions]
+    assert len(rows) == len(set(rows))
+
+    # Paging through gives the same completions
+    paged = []
+    cursor = None
+    while True:
+        page, cursor = lookup.complete(u'b', limit=37, cursor=cursor)
+        assert len(page) <= 37
+        paged.extend(page)
+        if cursor is None:
+            break
+    assert paged == completions
+
+
+@parametrize(
+    ('prefix', 'valid_types', 'tables', 'iso639'),
+    [
+        (u'pokemon:pi', [], [u'pokemon_species', u'pokemon_forms'], None),
+        (u'pi', [u'move'], [u'moves'], None),
+        (u'@ja:pi', [], None, u'ja'),
+        (u'pi', [u'@de'], None, u'de'),
+    ]
+)
+def test_complete_restricted(lookup, prefix, valid_types, tables, iso639):
+    completions, cursor = lookup.complete(prefix, valid_types, limit=1000)
+    assert completions
+    for completion in completions:
+        assert completion.indexed_name.startswith(u'pi')
+        assert tables is None or completion.table in tables
+        assert iso639 is None or completion.iso639 == iso639
+
+
+@parametrize('cursor', [u'', u'3', u'a.b', u'1.2.3'])
+def test_complete_bad_cursor(lookup, cursor):
+    with pytest.raises(ValueError):
+        lookup.complete(u'ee', cursor=cursor)
+
+
+def load_misspellings():
+    """Returns (misspelling, name) pairs from misspellings.txt."""
+    path = os.path.join(os.path.dirname(__file__), 'misspellings.txt')
+    with io.open(path, encoding='utf-8') as f:
+        return [tuple(line.rstrip(u'\n').split(u'\t'))
+                for line in f if not line.startswith(u'#')]
+
+
+def test_misspellings(lookup):
+    # Spelling correction suggests what was meant for every misspelling in
+    # the corpus, except those that are exactly right in another language
+    missed = []
+    for misspelling, name in load_misspellings():
+        misspelling = lookup.normalize_name(misspelling)
+        if lookup.names.find_names([misspelling]):
+            continue
+        suggestions = lookup.names.suggest(
+            misspelling, limit=lookup.MAX_FUZZY_RESULTS)
+        if lookup.normalize_name(name) not in suggestions:
+            missed.append((misspelling, name))
+    assert not missed
+
+
+@parametrize('misspelling', [u'evee', u'char', u'ab', u'flamethrowr', u'xyzzy'])
+def test_suggestions_match_corrector(lookup, misspelling):
+    with lookup.searchers.searcher() as searcher:
+        corrector = searcher.corrector('name')
+        assert (lookup.names.suggest(misspelling) ==
+                corrector.suggest(misspelling, limit=10))
@@ -1,8 +1,10 @@
 # Encoding: UTF-8
 
 import csv
+import os
 
 from pokedex.db import translations, tables
+from pokedex.defaults import get_default_csv_dir
 
 fake_version_names = (
     'version_id,local_language_id,name',
@@ -180,3 +182,36 @@ def check_leftjoin(seqa, seqb, expected, expected_unused):
     result = list(translations.leftjoin(seqa, seqb, unused=unused.append))
     assert result == list(expected)
     assert unused == list(expected_unused)
+
+def test_get_load_data(tmpdir):
+    csv_dir = get_default_csv_dir()
+    with open(os.path.join(csv_dir, 'languages.csv'), 'rb') as f:
+        tmpdir.join('languages.csv').write_binary(f.read())
+    translation_dir = tmpdir.mkdir('translations')
+    with open(os.path.join(csv_dir, 'translations', 'cs.csv'), 'rb') as f:
+        translation_dir.join('cs.csv').write_binary(f.read())
+    translation_dir.join('de.csv').write_binary(b'\n'.join([
+        b'language_id,table,id,column,source_crc,string',
+        b'6,Version,1,name,,Rot',
+        b'6,Version,2,name,,Blau',
+    ]) + b'\n')
+    transl = translations.Translations(csv_directory=str(tmpdir))
+
+    def load_data(**kwargs):
+        data = transl.get_load_data(batch_size=10, **kwargs)
+        batches = [(cls, rows) for cls, rows in data]
+        assert all(0 < len(rows) <= 10 for cls, rows in batches)
+        return sorted(((cls.__name__, sorted(row.items()))
+                      for cls, rows in batches for row in rows), key=repr)
+
+    german = load_data(langs=['de'])
+    assert german == [
+        ('version_names', [('local_language_id', 6), ('name', u'Blau'), ('version_id', 2)]),
+        ('version_names', [('local_language_id', 6), ('name', u'Rot'), ('version_id', 1)]),
+    ]
+
+    everything = load_data()
+    assert load_data(jobs=2) == everything
+    assert load_data(langs=['cs', 'de']) == everything
+    assert len(everything) > len(german)
+    assert load_data(langs=[]) == []
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+"""Benchmark for completing names as they're typed
+
+Times PokedexLookup.complete() for every prefix of each name, as if it were
+being typed one letter at a time, and for paging through all the completions
+of its first letter.  Reports the median and 99th percentile time per call,
+next to prefix_lookup() on the first prefixes for comparison.
+
+Needs a lookup index built by `pokedex reindex`.
+
+Usage: benchmark-completion.py [name ...]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from pokedex.lookup import PokedexLookup
+
+default_names = [u'eevee', u'charizard', u'thunderbolt', u'master ball', u'pikachu']
+
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    return result, (time.time() - start) * 1000
+
+
+def main(names):
+    lookup = PokedexLookup()
+    lookup.complete(u'')
+
+    typing = []
+    paging = []
+    prefix_lookups = []
+    for name in names:
+        for length in range(1, len(name) + 1):
+            result, ms = timed(lookup.complete, name[:length])
+            typing.append(ms)
+            if length <= 2:
+                result, ms = timed(lookup.prefix_lookup, name[:length])
+                prefix_lookups.append(ms)
+
+        cursor = None
+        while True:
+            (page, cursor), ms = timed(lookup.complete, name[:1], cursor=cursor)
+            paging.append(ms)
+            if cursor is None:
+                break
+
+    print('%-20s %8s %10s %10s' % ('', 'calls', 'p50 ms', 'p99 ms'))
+    for label, timings in [('complete, typing', typing),
+                           ('complete, paging', paging),
+                           ('prefix_lookup', prefix_lookups)]:
+        print('%-20s %8d %10.3f %10.3f' % (
+            label, len(timings),
+            percentile(timings, 0.5), percentile(timings, 0.99)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or default_names)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+"""Benchmark for spelling correction in lookups
+
+Runs every misspelling in pokedex/tests/misspellings.txt through whoosh's
+corrector and through the deletion dictionary of the name index, and
+reports how often each suggests the name that was meant (recall), and the
+median and 99th percentile time per misspelling.  Misspellings that are
+exactly right in some language are skipped, since lookups never correct
+them.
+
+Needs a lookup index built by `pokedex reindex`.
+
+Usage: benchmark-fuzzy-lookup.py [misspellings file]
+"""
+from __future__ import print_function
+
+import io
+import os
+import sys
+import time
+
+from pokedex.lookup import PokedexLookup
+
+default_corpus = os.path.join(os.path.dirname(__file__), '..', 'pokedex',
+                              'tests', 'misspellings.txt')
+
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def main(path):
+    lookup = PokedexLookup()
+    limit = lookup.MAX_FUZZY_RESULTS
+
+    with io.open(path, encoding='utf-8') as f:
+        misspellings = [
+            (lookup.normalize_name(misspelling), lookup.normalize_name(name))
+            for misspelling, name in (
+                line.rstrip(u'\n').split(u'\t')
+                for line in f if not line.startswith(u'#'))
+        ]
+    misspellings = [(misspelling, name) for misspelling, name in misspellings
+                    if not lookup.names.find_names([misspelling])]
+
+    with lookup.searchers.searcher() as searcher:
+        corrector = searcher.corrector('name')
+        suggesters = [
+            ('whoosh', lambda text: corrector.suggest(text, limit=limit)),
+            ('deletions', lambda text: lookup.names.suggest(text, limit=limit)),
+        ]
+
+        print('%d misspellings' % len(misspellings))
+        print('%-10s %8s %10s %10s' % ('suggester', 'recall', 'p50 ms', 'p99 ms'))
+        for label, suggest in suggesters:
+            found = 0
+            timings = []
+            for misspelling, name in misspellings:
+                start = time.time()
+                suggestions = suggest(misspelling)
+                timings.append((time.time() - start) * 1000)
+                found += name in suggestions
+
+            print('%-10s %7.1f%% %10.3f %10.3f' % (
+                label, 100.0 * found / len(misspellings),
+                percentile(timings, 0.5), percentile(timings, 0.99)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else default_corpus)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+"""Micro-benchmark for the CSV row conversion done by `pokedex load`
+
+Compares the old cell-by-cell conversion, which looked up every column and
+its type for every cell, against the per-table converters in
+pokedex.db.load.  No database is involved; only the conversion is timed.
+
+Usage: benchmark-load.py [table ...]
+"""
+from __future__ import print_function
+
+import csv
+import io
+import os
+import sys
+import timeit
+
+import six
+import sqlalchemy.types
+
+from pokedex.db import load, metadata
+from pokedex.defaults import get_default_csv_dir
+
+default_tables = ['encounters', 'ability_flavor_text', 'pokemon_species']
+
+
+def read_csv(table_name):
+    path = os.path.join(get_default_csv_dir(), table_name + '.csv')
+    with io.open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, lineterminator='\n')
+        column_names = [six.text_type(column) for column in next(reader)]
+        return column_names, list(reader)
+
+
+def convert_cell_by_cell(table_obj, column_names, rows):
+    """The conversion loop `load` used to have"""
+    for csvs in rows:
+        row_data = {}
+        for column_name, value in zip(column_names, csvs):
+            column = table_obj.c[column_name]
+            if column.nullable and value == '':
+                value = None
+            elif isinstance(column.type, sqlalchemy.types.Boolean):
+                if value == '0':
+                    value = False
+                else:
+                    value = True
+            elif isinstance(value, bytes):
+                value = value.decode('utf-8')
+            row_data[str(column_name)] = value
+
+
+def convert_compiled(table_obj, column_names, rows):
+    convert_row = load._get_row_converter(table_obj, column_names)
+    for csvs in rows:
+        convert_row(csvs)
+
+
+def main(table_names):
+    print('%-24s %8s %14s %14s %8s' % (
+        'table', 'rows', 'old rows/s', 'new rows/s', 'speedup'))
+    for table_name in table_names:
+        table_obj = metadata.tables[table_name]
+        column_names, rows = read_csv(table_name)
+
+        rates = []
+        for func in convert_cell_by_cell, convert_compiled:
+            seconds = min(timeit.repeat(
+                lambda: func(table_obj, column_names, rows),
+                number=1, repeat=5))
+            rates.append(len(rows) / seconds)
+
+        print('%-24s %8d %14.0f %14.0f %7.1fx' % (
+            table_name, len(rows), rates[0], rates[1], rates[1] / rates[0]))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or default_tables)
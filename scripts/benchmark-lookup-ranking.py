@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# Encoding: UTF-8
+"""Micro-benchmark for the ranking of lookup results
+
+Compares the old ranking, which sorted on a MultiFacet of LanguageFacet,
+the table and the name, against ranking by language group and the
+precomputed sort_key column of the index.  Both should keep the same hits
+in the same order ("same").  Only the search and sort are timed, not
+fetching the objects from the database.
+
+Needs a lookup index built by `pokedex reindex`.
+
+Usage: benchmark-lookup-ranking.py [query ...]
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+
+import whoosh.query
+import whoosh.sorting
+
+from pokedex.lookup import LanguageFacet, PokedexLookup, table_facet
+
+default_queries = [u'eevee', u'charge', u'a*', u'*on', u's???']
+
+
+def make_query(name):
+    if '*' in name or '?' in name:
+        return whoosh.query.Wildcard(u'name', name)
+    return whoosh.query.Term(u'name', name)
+
+
+def rank_old(lookup, searcher, query, locale, limit):
+    facet = whoosh.sorting.MultiFacet([
+        LanguageFacet(locale.identifier),
+        table_facet,
+        "name",
+    ])
+    return list(searcher.search(query, limit=limit, sortedby=facet))
+
+
+def rank_new(lookup, searcher, query, locale, limit):
+    return lookup._search(searcher, query, locale, limit=limit)
+
+
+def main(names):
+    lookup = PokedexLookup()
+    locale = lookup._get_current_locale()
+    limit = int(lookup.MAX_EXACT_RESULTS * lookup.INTERMEDIATE_FACTOR)
+
+    print('%-12s %8s %12s %12s %8s %6s' % (
+        'query', 'matches', 'old ms', 'new ms', 'speedup', 'same'))
+    with lookup.searchers.searcher() as searcher:
+        for name in names:
+            query = make_query(lookup.normalize_name(name))
+            matches = len(searcher.search(query, limit=None))
+
+            timings = []
+            rankings = []
+            for rank in rank_old, rank_new:
+                seconds = min(timeit.repeat(
+                    lambda: rank(lookup, searcher, query, locale, limit),
+                    number=10, repeat=5)) / 10
+                timings.append(seconds * 1000)
+                hits = rank(lookup, searcher, query, locale, limit)
+                rankings.append([(hit['table'], hit['row_id'], hit['name'])
+                                 for hit in hits])
+
+            print('%-12s %8d %12.3f %12.3f %7.1fx %6s' % (
+                name, matches, timings[0], timings[1],
+                timings[0] / timings[1], rankings[0] == rankings[1]))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or default_queries)